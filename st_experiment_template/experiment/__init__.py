@@ -14,10 +14,14 @@ Written by Samuel Thorpe
 from logging import getLogger
 import os
 from os.path import join
+import asyncio
+import inspect
 import importlib
 import hashlib
-from functools import partial, lru_cache
+from functools import partial
+from contextlib import contextmanager
 from datetime import datetime
+from time import perf_counter
 import dill
 import numpy as np
 from sampy.utils import load_yaml
@@ -25,6 +29,11 @@ from sampy.utils.logger import log_exceptions
 from sampy.utils.aws_s3 import AwsS3
 from st_experiment_template import BASE_DIR
 from st_experiment_template.experiment.report import Report
+from st_experiment_template.utils.trace import span, tracer
+from st_experiment_template.utils.s3_stage import S3Stager
+from st_experiment_template.utils.registry import RunRegistry, git_info
+from st_experiment_template.utils.threads import (
+    cpu_budget, native_threads, split_budget, thread_limits)
 
 
 # # Globals
@@ -39,6 +48,8 @@ class Experiment:
     """Class to run basic blocked DS experiment."""
 
     out_dir = os.path.join(BASE_DIR, 'run', 'batch')
+    state_dir = os.path.join(BASE_DIR, '.experiment')
+    max_concurrency = 100
 
     @log_exceptions()
     def __init__(self, cfg_file: str, **kwrgs):
@@ -46,25 +57,39 @@ class Experiment:
 
         Args:
             cfg_file (str): path to experiment config .yaml
-            **kwrgs
+            **kwrgs: out_dir (str, optional) overrides the class out_dir
         """
         logger.info('initializing experiment')
+        self.out_dir = kwrgs.get('out_dir', self.out_dir)
         self.exc = type(f'{self.__class__.__name__}Error', (Exception,), {})
+        self.cfg_file = cfg_file
         self.cfg = load_yaml(cfg_file)
         self.params = self.cfg.pop('ExperimentParams', {})
         self.src = self._build()
         self.blocks = {}
         self.data = {}
         self.report_items = []
-
-    def _build(self):
-        """Build experiment from cfg."""
+        self.metrics = {}
+        self.timings = {}
+        self.artifacts = []
+        self._report_marks = {}
+        self._loop = None
+        self._limiter = None
+        self._stager = None
+
+    def _build(self, start_idx=0):
+        """Build experiment from cfg, from block start_idx onward."""
         for block_idx, (cls_name, block_params) in enumerate(self.cfg.items()):
+            if block_idx < start_idx:
+                continue
             block_src = importlib.import_module(block_params['module'])
             block_obj = getattr(block_src, cls_name)
             block_obj._data = self.data
             block_obj._report_items = self.report_items
+            block_obj._metrics = self.metrics
             block_obj._out_dir = f'{self.out_dir}/{block_idx}-{cls_name}'
+            if inspect.iscoroutinefunction(block_obj.run):
+                block_obj._limiter = self.limiter
 
             # set rng seed if specified
             if self.params.get('block_rng_seed') is True:
@@ -72,7 +97,7 @@ class Experiment:
                     block_params['rng_seed'] = self._get_deterministic_seed(
                         block_params, cls_name)
 
-            yield (block_obj, block_params)
+            yield (block_idx, block_obj, block_params)
 
     def _get_deterministic_seed(self, block_params, cls_name, base_seed=8888):
         """Return the deterministic rng seed to initialize in block."""
@@ -81,33 +106,241 @@ class Experiment:
 
         return int.from_bytes(digest[:4], 'little')
 
+    # # Shared event loop for async blocks
+    # -----------------------------------------------------|
+    @property
+    def loop(self):
+        """Return the shared event loop, creating it on first use."""
+        if self._loop is None or self._loop.is_closed():
+            self._loop = asyncio.new_event_loop()
+            self._limiter = None
+
+        return self._loop
+
+    @property
+    def limiter(self):
+        """Return semaphore bounding concurrent I/O across async blocks.
+
+        Note: configured via ExperimentParams asyncio: max_concurrency. The
+              semaphore is bound to the shared loop, so it is recreated
+              along with the loop once the previous loop is closed.
+        """
+        loop = self.loop
+        if self._limiter is None:
+            async_params = self.params.get('asyncio') or {}
+            limit = async_params.get('max_concurrency', self.max_concurrency)
+
+            async def _new_semaphore():
+                return asyncio.Semaphore(limit)
+
+            self._limiter = loop.run_until_complete(_new_semaphore())
+
+        return self._limiter
+
+    def _close_loop(self):
+        """Close the shared event loop if one was created."""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.run_until_complete(self._loop.shutdown_asyncgens())
+            self._loop.close()
+
     # # Run Entry
     # -----------------------------------------------------|
     @log_exceptions()
     def run(self):
         """Run the experiment & report/push if specified"""
         logger.info('running experiment')
-        for block_idx, (block_obj, params) in enumerate(self.src):
-            self.blocks[block_idx] = block_obj(**params)
-            self.blocks[block_idx].run()
+        started, tic, status = datetime.now(), perf_counter(), 'failed'
+        trace_params = self.params.get('trace')
+        if trace_params:
+            tracer.start()
+        try:
+            with span('Experiment.run'):
+                self._stage_inputs(self.params.get('inputs'))
+                self._run_blocks()
+
+                # check configurable experiment params
+                for param in ['report', 'push']:
+                    params = self.params.get(param)
+                    if params:
+                        params = {} if params is True else params
+                        getattr(self, f'_{param}')(params)
+            status = 'ok'
+        finally:
+            self._close_loop()
+            if trace_params:
+                self._trace({} if trace_params is True else trace_params)
+            registry_params = self.params.get('registry', True)
+            if registry_params:
+                registry_params = {} if registry_params is True \
+                    else registry_params
+                try:
+                    self._register(
+                        registry_params, started, perf_counter() - tic,
+                        status)
+                except Exception:  # never mask the run outcome
+                    logger.exception('failed to register run')
 
-        # check configurable experiment params
-        for param in ['report', 'push']:
-            params = self.params.get(param)
-            if params:
-                params = {} if params is True else params
-                getattr(self, f'_{param}')(params)
+    @log_exceptions()
+    def rerun(self, start_idx=0):
+        """Re-import & re-run blocks from start_idx onward.
+
+        Note: data, report items & blocks upstream of start_idx are kept
+              in memory, so only the re-run blocks pay their cost. Re-run
+              blocks get recompute=True, so CheckRunBlocks do not reload
+              their stale cached outputs. Report, push, trace & registry
+              steps are not repeated.
+        """
+        logger.info(f're-running experiment from block {start_idx}')
+        mark = self._report_marks.get(start_idx, len(self.report_items))
+        del self.report_items[mark:]
+        self._close_loop()
+        self._loop = self._limiter = None
+        self.src = (
+            (block_idx, block_obj, dict(params, recompute=True))
+            for block_idx, block_obj, params in self._build(start_idx)
+        )
+        try:
+            self._run_blocks()
+        finally:
+            self._close_loop()
+
+    def _run_blocks(self):
+        """Instantiate & run each configured block in sequence.
+
+        Note: blocks with an async run method are driven on the shared event
+              loop. If ExperimentParams asyncio: gather is True, consecutive
+              async blocks are run concurrently, i.e. they are all
+              instantiated before any of them runs.
+        """
+        gather = (self.params.get('asyncio') or {}).get('gather', False)
+        pending = []
+        for block_idx, block_obj, params in self.src:
+            name = block_obj.__name__
+            self._report_marks[block_idx] = len(self.report_items)
+            self._stage_inputs(params.get('inputs'))
+            tic = perf_counter()
+            with span(f'{name}.__init__', cat='block'):
+                block = self.blocks[block_idx] = block_obj(**params)
+            self.timings[block_idx] = perf_counter() - tic
+
+            if inspect.iscoroutinefunction(block.run):
+                pending.append(block_idx)
+                if not gather:
+                    pending = self._await_blocks(pending)
+            else:
+                pending = self._await_blocks(pending)
+                tic = perf_counter()
+                with self._thread_budget([block_idx]):
+                    with span(f'{name}.run', cat='block'):
+                        block.run()
+                self.timings[block_idx] += perf_counter() - tic
+        self._await_blocks(pending)
+
+    def _await_blocks(self, block_idxs):
+        """Run async blocks concurrently on the shared loop; return [].
+
+        Note: if any block fails, the others are cancelled & awaited before
+              the first error is re-raised, so no block keeps running.
+        """
+        async def _run(block_idx):
+            block, tic = self.blocks[block_idx], perf_counter()
+            with span(f'{block.__class__.__name__}.run', cat='block'):
+                await block.run()
+            self.timings[block_idx] += perf_counter() - tic
+
+        async def _gather():
+            tasks = [
+                asyncio.create_task(
+                    _run(x), name=self.blocks[x].__class__.__name__)
+                for x in block_idxs
+            ]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+
+        if block_idxs:
+            with self._thread_budget(block_idxs):
+                self.loop.run_until_complete(_gather())
+
+        return []
+
+    @contextmanager
+    def _thread_budget(self, block_idxs):
+        """Limit native thread pools for blocks about to run concurrently.
+
+        Note: the budget is ExperimentParams threads (default all available
+              cpus), split across the blocks by split_budget honoring any
+              per-block threads params. Native pools are process-wide, so
+              the smallest allotment is applied to the whole group. Nothing
+              is applied for a lone block when no threads params are set.
+        """
+        requested = [self.blocks[x].params.get('threads') for x in block_idxs]
+        if 'threads' not in self.params and requested == [None]:
+            yield
+            return
+
+        budget = self.params.get('threads') or cpu_budget()
+        n_threads = min(split_budget(budget, requested))
+        with thread_limits(n_threads):
+            names = [self.blocks[x].__class__.__name__ for x in block_idxs]
+            logger.info(
+                f'running {names} with {n_threads} native thread(s) of '
+                f'{budget}: {native_threads()}'
+            )
+            yield
 
     # # Configurable experiment param helpers
     # -----------------------------------------------------|
+    @property
+    def stager(self):
+        """Return S3 input stager configured by ExperimentParams.
+
+        Note: configured via ExperimentParams input_cache: dir, max_gb,
+              part_mb & workers. The cache defaults to the state_dir, which
+              is shared across runs & kept out of the pushed run dir.
+        """
+        if self._stager is None:
+            cache_params = self.params.get('input_cache') or {}
+            cache_dir = join(self.state_dir, 'cache', 's3')
+            self._stager = S3Stager(
+                cache_params.get('dir', cache_dir),
+                max_bytes=int(cache_params.get('max_gb', 50) * (1 << 30)),
+                part_size=int(cache_params.get('part_mb', 8) * (1 << 20)),
+                workers=cache_params.get('workers', 16)
+            )
+
+        return self._stager
+
+    def _stage_inputs(self, inputs):
+        """Stage S3 inputs locally & expose their paths/handles in data."""
+        if inputs:
+            logger.info(f'staging inputs: {list(inputs)}')
+            with span('stage_inputs', cat='io', inputs=list(inputs)):
+                self.data.update(self.stager.stage_all(inputs))
+
+    @property
+    def _run_dir(self):
+        """Return dir holding this run's outputs (batch, report & trace)."""
+        return os.path.dirname(self.out_dir)
+
     def _report(self, report_params):
-        """Create experiment report."""
+        """Create experiment report in the run dir."""
         logger.info('creating report')
-        report = Report(self.report_items, **report_params)
+        report_params = dict(
+            dict(report_dir=join(self._run_dir, 'report')), **report_params)
+        with span('Report.build', cat='report'):
+            report = Report(self.report_items, **report_params)
         report.export()
+        self.artifacts.append(
+            ('report', join(report.report_dir, report.report_fn)))
 
+    @span('Experiment._push', cat='push')
     def _push(self, push_params):
-        """Push experiment outputs as configured."""
+        """Push the run dir's outputs as configured."""
         logger.info('pushing experiment')
         _now_ = datetime.now().strftime('%Y%m%d-%H%M%S')
         cfg_prefix = push_params.get('prefix', '')
@@ -115,10 +348,52 @@ class Experiment:
 
         s3 = AwsS3()
         s3.upload_folder_to_s3(
-            local_dir='run',
+            local_dir=self._run_dir,
             bucket_name=push_params['bucket'],
             prefix=prefix
         )
+        bucket = push_params['bucket']
+        self.artifacts.append(('s3', f's3://{bucket}/{prefix}'))
+
+    def _trace(self, trace_params):
+        """Stop tracing & write the run's chrome trace-event json."""
+        tracer.stop()
+        _now_ = datetime.now().strftime('%Y%m%d-%H%M%S')
+        trace_dir = join(self._run_dir, 'trace')
+        trace_pth = trace_params.get(
+            'path', join(trace_dir, f'trace-{_now_}.json'))
+        tracer.export(trace_pth)
+        self.artifacts.append(('trace', trace_pth))
+
+    def _register(self, registry_params, started, duration, status):
+        """Record run config, params, timings, metrics & artifacts."""
+        db_pth = registry_params.get(
+            'path', join(self.state_dir, 'registry.sqlite'))
+        git_commit, git_dirty = git_info()
+        blocks = [
+            dict(
+                idx=idx, name=name, module=params['module'], params=params,
+                duration=self.timings.get(idx)
+            )
+            for idx, (name, params) in enumerate(self.cfg.items())
+        ]
+        artifacts = [('block', x._out_dir) for x in self.blocks.values()]
+        registry = RunRegistry(db_pth)
+        self.run_id = registry.record(dict(
+            started=started.isoformat(timespec='seconds'),
+            duration=duration,
+            status=status,
+            cfg_file=self.cfg_file,
+            cfg=dict(ExperimentParams=self.params, **self.cfg),
+            git_commit=git_commit,
+            git_dirty=git_dirty,
+            out_dir=self.out_dir,
+            blocks=blocks,
+            metrics=self.metrics,
+            artifacts=artifacts + self.artifacts
+        ))
+        registry.close()
+        logger.info(f'registered run {self.run_id} in {db_pth}')
 
 
 # # Experiment Block Base Class
@@ -126,6 +401,8 @@ class Experiment:
 class Block:
     """Initialize class."""
 
+    _artifact_cache = None
+
     def __init__(self, **params):
         """Instantiate class.
 
@@ -153,22 +430,49 @@ class Block:
         """Raise custom class exception on failure."""
         raise self.exc(msg)
 
+    def _metric(self, name, value):
+        """Publish scalar metric to the run registry as <Block>.<name>."""
+        self._metrics[f'{self.__class__.__name__}.{name}'] = float(value)
+
+    async def _limit(self, awaitable):
+        """Await awaitable under the experiment-wide concurrency limiter."""
+        async with self._limiter:
+            return await awaitable
+
     def _cache(self, dat, file_name, prefix=None):
         """Save pickled binary file."""
         logger.info(f'saving {file_name}')
         if prefix is not None:
             file_name = join(prefix, file_name)
-        with open(join(self._out_dir, file_name), 'wb') as pkl:
-            dill.dump(dat, pkl)
+        with span('Block._cache', cat='io', file=file_name):
+            with open(join(self._out_dir, file_name), 'wb') as pkl:
+                dill.dump(dat, pkl)
 
-    @lru_cache
     def _load(self, file_name, prefix=None):
-        """Load pickled binary file."""
-        logger.info(f'loading {file_name}')
+        """Load pickled binary file.
+
+        Note: loads are memoized per block instance, or by the process-wide
+              artifact cache when one is installed (e.g. service workers).
+        """
         if prefix is not None:
             file_name = join(prefix, file_name)
-        with open(join(self._out_dir, file_name), 'rb') as pkl:
-            return dill.load(pkl)
+        pth = join(self._out_dir, file_name)
+        if self._artifact_cache is not None:
+            return self._artifact_cache.get(pth, self._read_pkl)
+
+        loaded = self.__dict__.setdefault('_loaded', {})
+        if pth not in loaded:
+            loaded[pth] = self._read_pkl(pth)
+
+        return loaded[pth]
+
+    @staticmethod
+    def _read_pkl(pth):
+        """Read pickled binary file."""
+        logger.info(f'loading {pth}')
+        with span('Block._load', cat='io', file=pth):
+            with open(pth, 'rb') as pkl:
+                return dill.load(pkl)
 
     @staticmethod
     def _import(full_class_name):
@@ -204,21 +508,37 @@ class CheckRunBlock(Block):
               are loaded from disk. Otherwise, the original run method is
               executed and the outputs are cached to disk.
         """
-        def inner():
-            logger.info(f'running {self.__class__.__name__}')
-            if self._recompute is True or not self._outputs_present():
-                run_outputs = run_method()
-                for key, file in self.outputs.items():
-                    out_pth = f'{self._out_dir}/{file}'
-                    self._cache(run_outputs[key], out_pth)
-                    self._data[key] = partial(self._load, out_pth)
-            else:
-                for key, file in self.outputs.items():
-                    out_pth = f'{self._out_dir}/{file}'
-                    self._data[key] = partial(self._load, out_pth)
+        name = self.__class__.__name__
+
+        if inspect.iscoroutinefunction(run_method):
+            @span(f'{name}.check_run', cat='block')
+            async def inner():
+                logger.info(f'running {self.__class__.__name__}')
+                run_outputs = None
+                if self._recompute is True or not self._outputs_present():
+                    with span(f'{name}.run_method', cat='block'):
+                        run_outputs = await run_method()
+                self._store_outputs(run_outputs)
+        else:
+            @span(f'{name}.check_run', cat='block')
+            def inner():
+                logger.info(f'running {self.__class__.__name__}')
+                run_outputs = None
+                if self._recompute is True or not self._outputs_present():
+                    with span(f'{name}.run_method', cat='block'):
+                        run_outputs = run_method()
+                self._store_outputs(run_outputs)
 
         return inner
 
+    def _store_outputs(self, run_outputs=None):
+        """Cache run_outputs if given & point _data at the cached outputs."""
+        for key, file in self.outputs.items():
+            out_pth = f'{self._out_dir}/{file}'
+            if run_outputs is not None:
+                self._cache(run_outputs[key], out_pth)
+            self._data[key] = partial(self._load, out_pth)
+
     def _outputs_present(self):
         """Return False if any outputs are missing."""
         for key, file in self.outputs.items():
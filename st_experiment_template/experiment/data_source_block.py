@@ -0,0 +1,435 @@
+"""
+Module housing built-in data-source experiment blocks.
+
+Data-source blocks parse raw csv/json inputs once, in parallel chunks, into a
+memory-mappable columnar cache (one .npy file per column) and expose a loader
+of the DataFrame in _data, following the CheckRunBlock convention, e.g.
+self._data['raw'](). Re-runs on unchanged inputs skip parsing entirely and
+memory-map the cached columns. The loaded columns are read-only.
+
+# NOTES
+# ----------------------------------------------------------------------------|
+Example config:
+
+    CsvSourceBlock:
+      module: st_experiment_template.experiment.data_source_block
+      glob: data/raw/*.csv
+      key: raw
+      schema:
+        user_id: int64
+        score: float32
+      chunksize: 1000000
+      workers: 4
+
+Params:
+    path (str | list): input file path(s)
+    glob (str | list): input glob pattern(s); combined with path if both set
+    key (str, optional): _data key for the DataFrame; defaults to class name
+    schema (dict, optional): column -> dtype passed to the reader
+    read_kw (dict, optional): extra kwargs passed to the pandas reader
+    chunksize (int, optional): rows parsed per chunk
+    workers (int, optional): parallel parse processes; 1 parses inline
+    split_mb (float, optional): split uncompressed csv & json lines files
+                                into line-aligned byte ranges of about this
+                                size, parsed in parallel; 0 disables
+    hash (str, optional): content hash in cache key; sample, full or none
+    cache_dir (str, optional): cache location; defaults to block out_dir
+
+Cache keys combine each input's path, size, mtime and content hash with the
+schema & reader kwargs, so any change to inputs or params triggers a rebuild.
+String columns are stored as categorical codes (memory-mapped) plus their
+categories. A non-default index (e.g. read_kw index_col) is stored as
+leading columns and restored on load. After a rebuild, the block's caches
+for stale keys are removed from the cache dir.
+
+Byte-range splitting assumes one record per line, so csv inputs with quoted
+multi-line fields must set split_mb: 0. Files are not split when read_kw sets
+header, names, skiprows, skipfooter or nrows.
+
+
+Written by Samuel Thorpe
+"""
+
+
+# # Imports
+# -----------------------------------------------------|
+from logging import getLogger
+import os
+from os.path import exists, getmtime, getsize, join, abspath
+import io
+import json
+import glob
+import shutil
+import hashlib
+from time import perf_counter
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from st_experiment_template.experiment import Block
+from st_experiment_template.utils.trace import span
+logger = getLogger(__name__)
+
+
+# # Globals
+# -----------------------------------------------------|
+CHUNKSIZE = 1_000_000
+SPLIT_MB = 64
+SPLIT_UNSAFE_KW = {'header', 'names', 'skiprows', 'skipfooter', 'nrows'}
+COMPRESSED_EXTS = ('.gz', '.bz2', '.zip', '.xz', '.zst', '.tar')
+HASH_SAMPLE_BYTES = 1 << 20
+CACHE_VERSION = 1
+
+
+# # Data Source Base Class
+# -----------------------------------------------------|
+class DataSourceBlock(Block):
+    """Base block to parse inputs into a cached columnar DataFrame."""
+
+    reader = None
+
+    def run(self):
+        """Build the cache if stale & store its loader in _data."""
+        logger.info(f'running {self.__class__.__name__}')
+        files = self._input_files()
+        if not files:
+            self.fail('no input files matched path/glob params')
+
+        key = self.params.get('key', self.__class__.__name__)
+        source = f'{self.__class__.__name__}:{key}'
+        cache_root = self.params.get('cache_dir', join(self._out_dir, 'cache'))
+        cache_dir = join(cache_root, self._cache_key(files))
+        if not exists(join(cache_dir, 'meta.json')):
+            tic = perf_counter()
+            with span(f'{self.__class__.__name__}.convert', cat='io'):
+                self._convert(files, cache_dir, source)
+            toc = perf_counter() - tic
+            logger.info(f'built cache {cache_dir} in {toc:.2f}s')
+            _prune_caches(cache_root, cache_dir, source)
+
+        self._data[key] = partial(load_columnar, cache_dir)
+
+    def _input_files(self):
+        """Return sorted list of input files from path & glob params."""
+        files = []
+        for param in ['path', 'glob']:
+            pths = self.params.get(param, [])
+            pths = [pths] if isinstance(pths, str) else pths
+            for pth in pths:
+                files += glob.glob(pth) if param == 'glob' else [pth]
+
+        return sorted({abspath(x) for x in files})
+
+    def _cache_key(self, files):
+        """Return cache key over input signatures & reader params."""
+        hash_mode = self.params.get('hash', 'sample')
+        sig = dict(
+            version=CACHE_VERSION,
+            reader=self.reader,
+            schema=self.params.get('schema'),
+            read_kw=self.params.get('read_kw'),
+            files=[
+                (pth, getsize(pth), getmtime(pth),
+                 _file_digest(pth, hash_mode))
+                for pth in files
+            ]
+        )
+        sig = json.dumps(sig, sort_keys=True, default=str).encode()
+
+        return hashlib.sha256(sig).hexdigest()[:16]
+
+    def _convert(self, files, cache_dir, source=None):
+        """Parse file byte ranges in parallel & merge into columnar cache."""
+        logger.info(f'converting {len(files)} input file(s)')
+        tmp_dir = f'{cache_dir}.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        read_kw = self.params.get('read_kw', {})
+        split_bytes = int(self.params.get('split_mb', SPLIT_MB) * (1 << 20))
+        args = []
+        for idx, pth in enumerate(files):
+            if split_bytes and _splittable(self.reader, pth, read_kw):
+                rngs = _byte_ranges(pth, split_bytes)
+            else:
+                rngs = [None]
+            args += [
+                (
+                    self.reader, pth, join(tmp_dir, f'{idx}-{rng_idx}'),
+                    self.params.get('chunksize', CHUNKSIZE),
+                    self.params.get('schema'), read_kw, rng
+                )
+                for rng_idx, rng in enumerate(rngs)
+            ]
+        workers = min(self.params.get('workers', os.cpu_count()), len(args))
+        if workers > 1:
+            with ProcessPoolExecutor(workers) as pool:
+                parts = list(pool.map(_parse_to_parts, *zip(*args)))
+        else:
+            parts = [_parse_to_parts(*x) for x in args]
+
+        _merge_parts([x for y in parts for x in y], tmp_dir, source)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        os.replace(tmp_dir, cache_dir)
+
+
+# # Concrete Data Source Blocks
+# -----------------------------------------------------|
+class CsvSourceBlock(DataSourceBlock):
+    """Data source block for csv inputs."""
+
+    reader = 'csv'
+
+
+class JsonSourceBlock(DataSourceBlock):
+    """Data source block for json inputs (chunked if read_kw lines=True)."""
+
+    reader = 'json'
+
+
+# # Columnar cache helpers
+# -----------------------------------------------------|
+def load_columnar(cache_dir):
+    """Return DataFrame over memory-mapped columns in cache_dir."""
+    meta = json.load(open(join(cache_dir, 'meta.json')))
+    cols = {}
+    for idx, col in enumerate(meta['columns']):
+        arr = np.load(join(cache_dir, f'{idx}.npy'), mmap_mode='r')
+        if col['categorical']:
+            cats = np.load(join(cache_dir, f'{idx}.cats.npy'),
+                           allow_pickle=True)
+            arr = pd.Categorical.from_codes(arr, categories=cats)
+        cols[col['name']] = arr
+    dfr = pd.DataFrame(cols, copy=False)
+
+    index = meta.get('index', [])
+    if index:
+        dfr = dfr.set_index(list(dfr.columns[:len(index)]))
+        dfr.index.names = index
+
+    return dfr
+
+
+def _prune_caches(cache_root, cache_dir, source):
+    """Remove caches in cache_root built by source, other than cache_dir."""
+    for entry in os.scandir(cache_root):
+        pth = join(cache_root, entry.name)
+        if pth == cache_dir or not exists(join(pth, 'meta.json')):
+            continue
+        if json.load(open(join(pth, 'meta.json'))).get('source') == source:
+            logger.info(f'removing stale cache {pth}')
+            shutil.rmtree(pth, ignore_errors=True)
+
+
+def _read_chunks(reader, pth, chunksize, schema, read_kw, rng=None):
+    """Yield DataFrame chunks of pth (or its byte range rng) via pandas."""
+    src = pth
+    if rng is not None:
+        src = io.TextIOWrapper(
+            io.BufferedReader(_RangeIO(pth, *rng)),
+            encoding=read_kw.get('encoding') or 'utf-8', newline=''
+        )
+        if reader == 'csv' and rng[0] > 0:
+            names = _csv_names(pth, read_kw)
+            read_kw = dict(read_kw, header=None, names=names)
+
+    if reader == 'csv':
+        yield from pd.read_csv(
+            src, chunksize=chunksize, dtype=schema, **read_kw)
+    elif reader == 'json' and read_kw.get('lines'):
+        yield from pd.read_json(
+            src, chunksize=chunksize, dtype=schema, **read_kw)
+    elif reader == 'json':
+        yield pd.read_json(pth, dtype=schema, **read_kw)
+    else:
+        raise ValueError(f'unsupported reader: {reader}')
+
+
+def _parse_to_parts(reader, pth, part_dir, chunksize, schema, read_kw,
+                    rng=None):
+    """Parse pth chunk-wise, saving each chunk's columns as .npy parts.
+
+    Note: a non-default (named or not Range) index is saved as leading
+          columns.
+    """
+    parts = []
+    for idx, chunk in enumerate(
+            _read_chunks(reader, pth, chunksize, schema, read_kw, rng)):
+        index = []
+        if chunk.index.names != [None] or \
+                not isinstance(chunk.index, pd.RangeIndex):
+            index = list(chunk.index.names)
+            chunk = chunk.reset_index()
+        chunk_dir = join(part_dir, str(idx))
+        os.makedirs(chunk_dir, exist_ok=True)
+        dtypes = []
+        for col_idx, col in enumerate(chunk.columns):
+            arr = _to_numpy(chunk[col])
+            np.save(join(chunk_dir, f'{col_idx}.npy'), arr,
+                    allow_pickle=arr.dtype == object)
+            dtypes.append(arr.dtype.str)
+        parts.append(dict(
+            dir=chunk_dir,
+            rows=len(chunk),
+            columns=[str(x) for x in chunk.columns],
+            dtypes=dtypes,
+            index=index
+        ))
+
+    return parts
+
+
+def _merge_parts(parts, out_dir, source=None):
+    """Concatenate chunk parts into one .npy file per column in out_dir."""
+    if not parts:
+        raise ValueError('input files contain no rows')
+    columns, index = parts[0]['columns'], parts[0]['index']
+    if any(x['columns'] != columns or x['index'] != index for x in parts):
+        raise ValueError('input files/chunks have mismatched columns')
+    n_rows = sum(x['rows'] for x in parts)
+
+    meta = dict(rows=n_rows, columns=[], index=index, source=source)
+    for idx, name in enumerate(columns):
+        dtypes = [np.dtype(x['dtypes'][idx]) for x in parts]
+        categorical = any(x == object for x in dtypes)
+        if categorical:
+            _merge_categorical(parts, idx, n_rows, out_dir)
+        else:
+            dtype = np.result_type(*dtypes)
+            _merge_numeric(parts, idx, dtype, n_rows, out_dir)
+        meta['columns'].append(dict(name=name, categorical=categorical))
+
+    for part in parts:
+        shutil.rmtree(part['dir'])
+    with open(join(out_dir, 'meta.json'), 'w') as fh:
+        json.dump(meta, fh)
+
+
+def _merge_numeric(parts, idx, dtype, n_rows, out_dir):
+    """Stream numeric column parts into a single memory-mapped .npy."""
+    out = np.lib.format.open_memmap(
+        join(out_dir, f'{idx}.npy'), mode='w+', dtype=dtype, shape=(n_rows,))
+    row = 0
+    for part in parts:
+        arr = np.load(join(part['dir'], f'{idx}.npy'))
+        out[row:row + len(arr)] = arr
+        row += len(arr)
+    out.flush()
+    del out
+
+
+def _merge_categorical(parts, idx, n_rows, out_dir):
+    """Stream object column parts into categorical codes & categories.
+
+    Note: categories are the union of each part's unique values, so only
+          one part's values are held in memory at a time.
+    """
+    def _load_part(part):
+        return np.load(
+            join(part['dir'], f'{idx}.npy'), allow_pickle=True).astype(object)
+
+    cats = {}
+    for part in parts:
+        cats.update(dict.fromkeys(pd.Series(_load_part(part)).dropna()))
+    try:
+        cats = pd.Index(sorted(cats), dtype=object)
+    except TypeError:  # mixed types; keep first-seen order
+        cats = pd.Index(list(cats), dtype=object)
+
+    dtype = np.result_type(np.int8, np.min_scalar_type(len(cats)))
+    out = np.lib.format.open_memmap(
+        join(out_dir, f'{idx}.npy'), mode='w+', dtype=dtype, shape=(n_rows,))
+    row = 0
+    for part in parts:
+        codes = pd.Categorical(_load_part(part), categories=cats).codes
+        out[row:row + len(codes)] = codes
+        row += len(codes)
+    out.flush()
+    del out
+    np.save(join(out_dir, f'{idx}.cats.npy'),
+            np.asarray(cats, dtype=object), allow_pickle=True)
+
+
+def _splittable(reader, pth, read_kw):
+    """Return True if pth can be parsed as independent byte ranges."""
+    line_based = reader == 'csv' or (reader == 'json' and read_kw.get('lines'))
+    compressed = read_kw.get('compression', 'infer') not in ('infer', None) \
+        or pth.lower().endswith(COMPRESSED_EXTS)
+
+    return line_based and not compressed and not SPLIT_UNSAFE_KW & set(read_kw)
+
+
+def _byte_ranges(pth, split_bytes):
+    """Return line-aligned [start, end) byte ranges of about split_bytes."""
+    size = getsize(pth)
+    bounds = [0]
+    with open(pth, 'rb') as fh:
+        for pos in range(split_bytes, size, split_bytes):
+            if pos <= bounds[-1]:
+                continue
+            fh.seek(pos - 1)
+            fh.readline()
+            if fh.tell() >= size:
+                break
+            bounds.append(fh.tell())
+    bounds.append(size)
+
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _csv_names(pth, read_kw):
+    """Return the header column names of csv file pth."""
+    kw = {
+        key: val for key, val in read_kw.items()
+        if key not in ('usecols', 'index_col', 'dtype')
+    }
+    return list(pd.read_csv(pth, nrows=0, **kw).columns)
+
+
+class _RangeIO(io.RawIOBase):
+    """Read-only raw file view over byte range [start, end) of pth."""
+
+    def __init__(self, pth, start, end):
+        """Initialize class."""
+        self.fh = open(pth, 'rb')
+        self.fh.seek(start)
+        self.remaining = end - start
+
+    def readable(self):
+        """Return True; range views are readable."""
+        return True
+
+    def readinto(self, buf):
+        """Read up to len(buf) bytes of the range into buf."""
+        view = memoryview(buf)[:min(len(buf), self.remaining)]
+        n_bytes = self.fh.readinto(view)
+        self.remaining -= n_bytes
+        return n_bytes
+
+    def close(self):
+        """Close underlying file."""
+        self.fh.close()
+        super().close()
+
+
+def _to_numpy(series):
+    """Return plain numpy array for series; extension/str dtypes -> object."""
+    if isinstance(series.dtype, np.dtype) and series.dtype != object:
+        return series.to_numpy()
+
+    return series.to_numpy(dtype=object)
+
+
+def _file_digest(pth, hash_mode):
+    """Return content digest of pth; full, sampled head/tail or none."""
+    if hash_mode in (None, False, 'none'):
+        return None
+    digest = hashlib.blake2b(digest_size=16)
+    with open(pth, 'rb') as fh:
+        if hash_mode == 'full':
+            for blk in iter(lambda: fh.read(HASH_SAMPLE_BYTES), b''):
+                digest.update(blk)
+        else:
+            digest.update(fh.read(HASH_SAMPLE_BYTES))
+            fh.seek(max(0, getsize(pth) - HASH_SAMPLE_BYTES))
+            digest.update(fh.read(HASH_SAMPLE_BYTES))
+
+    return digest.hexdigest()
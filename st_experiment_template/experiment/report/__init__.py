@@ -13,9 +13,13 @@ Written by Samuel Thorpe
 import os
 from os.path import basename, dirname, join, splitext
 import json
+import re
+from uuid import uuid4
 from datetime import datetime
 from subprocess import call
+import pandas as pd
 from st_experiment_template import BASE_DIR
+from st_experiment_template.utils.trace import span
 
 
 # # Globals
@@ -34,6 +38,53 @@ img {
 </style>
 """))
 '''.strip()
+TABLE_MAX_ROWS = 1000
+TABLE_PAGE_SIZE = 500
+TABLE_PAGER_JS = '''
+<script>
+(function() {
+    var tid = "%(tid)s", src = %(src)s, n_pages = %(n_pages)d;
+    var columns = %(columns)s, page_size = %(page_size)d;
+    var reg = window.stTablePages = window.stTablePages || {};
+    var pages = reg[tid] = reg[tid] || {};
+    var page = 0;
+    function el(id) { return document.getElementById(tid + "-" + id); }
+    function cell(tag, val) {
+        var node = document.createElement(tag);
+        node.textContent = val === null ? "" : String(val);
+        return node;
+    }
+    function render(dat) {
+        var table = document.createElement("table");
+        var head = table.createTHead().insertRow();
+        table.className = "dataframe";
+        head.appendChild(cell("th", ""));
+        columns.forEach(function(c) { head.appendChild(cell("th", c)); });
+        var body = table.createTBody();
+        dat.data.forEach(function(row, i) {
+            var tr = body.insertRow();
+            var idx = dat.index ? dat.index[i] : page * page_size + i;
+            tr.appendChild(cell("th", idx));
+            row.forEach(function(v) { tr.appendChild(cell("td", v)); });
+        });
+        el("body").replaceChildren(table);
+        el("page").value = page + 1;
+    }
+    function load(idx) {
+        page = Math.max(0, Math.min(n_pages - 1, idx));
+        if (pages[page]) { return render(pages[page]); }
+        var tag = document.createElement("script");
+        tag.src = src + "/" + page + ".js";
+        tag.onload = function() { render(pages[page]); };
+        document.head.appendChild(tag);
+    }
+    el("prev").onclick = function() { load(page - 1); };
+    el("next").onclick = function() { load(page + 1); };
+    el("page").onchange = function() { load(this.value - 1); };
+    load(0);
+})();
+</script>
+'''.strip()
 
 
 # # Main Report Class for Inheritance
@@ -47,6 +98,7 @@ class Report():
         self.tagline = params.get('tagline', '')
         self.desc = params.get('description', 'insert experiment description.')
         self.report_fn = params.get('report_fn')
+        self.report_dir = params.get('report_dir', REPORT_DIR)
         self.report = self._build_report(report_items)
 
     def _build_report(self, report_items):
@@ -93,17 +145,19 @@ class Report():
             metadata=item['meta']
         ))
 
+    @span('Report.export', cat='report')
     def export(self):
         """Write out the report and convert to html."""
         if self.report_fn is None:
             now = datetime.now().strftime("%Y%m%d-%H%M%S")
             self.report_fn = f'{basename(BASE_DIR)}-{now}'
 
-        report_dir = join(REPORT_DIR, self.report_fn)
+        report_dir = join(self.report_dir, self.report_fn)
         os.makedirs(report_dir, exist_ok=True)
         report_pth = join(report_dir, f'{self.report_fn}.ipynb')
-        with open(report_pth, "w") as fh:
-            json.dump(self.report, fh, indent=4)
+        with span('Report.write', cat='report'):
+            with open(report_pth, "w") as fh:
+                json.dump(self.report, fh, indent=4)
         cmd = [
             'jupyter',
             'nbconvert',
@@ -116,7 +170,8 @@ class Report():
             'html',
             report_pth
         ]
-        call(cmd)
+        with span('nbconvert', cat='report'):
+            call(cmd)
 
 
 # # Report building helpers
@@ -155,6 +210,111 @@ def report_table(dfr, hdr='Table', desc='insert description'):
     return report_item(hdr, desc, content=table_html)
 
 
+def report_large_table(dfr, out_dir, hdr='Table', desc='insert description',
+                       max_rows=TABLE_MAX_ROWS, page_size=TABLE_PAGE_SIZE,
+                       n_sample=10):
+    """Structure large dataframe as summarized, paginated report item.
+
+    NOTE: tables with at most max_rows rows fall back to report_table.
+          Otherwise only a fixed size summary (head/tail, describe & sampled
+          rows) is embedded in the report, and two copies of the full table
+          are written to out_dir:
+          - per-page .js chunks, the format the rendered pager lazy-loads
+            in the browser. Chunks hold only the row values (plus the index
+            if it is not the default range index), as column names are
+            embedded once in the pager.
+          - a compact sidecar (parquet, else gzip csv) linked from the
+            report for downloading/analysing the full data.
+    """
+    if len(dfr) <= max_rows:
+        return report_table(dfr, hdr, desc)
+
+    # write full data sidecar & lazy-loadable page chunks
+    slug = re.sub(r'[^0-9a-zA-Z]+', '_', hdr).strip('_')
+    tid = f'{slug}-{uuid4().hex[:8]}'
+    sidecar = _write_table_sidecar(dfr, join(out_dir, tid))
+    page_dir = join(out_dir, tid)
+    n_pages = _write_table_pages(dfr, page_dir, tid, page_size)
+
+    # compile summary & pager html
+    fmt = dict(index=True, float_format='{:.2f}'.format)
+    gap = pd.DataFrame('...', index=['...'], columns=dfr.columns)
+    head_tail = pd.concat([dfr.head(n_sample), gap, dfr.tail(n_sample)])
+    sample = dfr.sample(min(n_sample, len(dfr)), random_state=0).sort_index()
+    html_str = '\n'.join([
+        f'<p><i>{len(dfr):,} rows x {dfr.shape[1]} columns, full data: '
+        f'<a href="{sidecar}">{basename(sidecar)}</a></i></p>',
+        '<h4>Head / Tail</h4>', head_tail.to_html(**fmt),
+        '<h4>Summary</h4>', dfr.describe(include='all').to_html(**fmt),
+        '<h4>Sampled Rows</h4>', sample.to_html(**fmt),
+        '<h4>All Rows</h4>',
+        f'<div><button id="{tid}-prev">&lt;</button> page '
+        f'<input id="{tid}-page" type="number" min="1" max="{n_pages}" '
+        f'style="width:5em"> of {n_pages:,} '
+        f'<button id="{tid}-next">&gt;</button></div>',
+        f'<div id="{tid}-body"></div>',
+        TABLE_PAGER_JS % dict(
+            tid=tid, src=_js_literal(page_dir), n_pages=n_pages,
+            columns=_js_literal([str(x) for x in dfr.columns]),
+            page_size=page_size
+        ),
+    ])
+    content = '\n'.join([
+        'from IPython.display import display, HTML',
+        f'display(HTML({html_str!r}))'
+    ])
+    meta = {"tags": ["hide_input"]}
+
+    return report_item(hdr, desc, content, meta=meta, type='code')
+
+
+def _write_table_sidecar(dfr, pth):
+    """Write full table compactly: parquet if possible, else gzip csv.
+
+    Note: falls back to csv when no parquet engine is installed or the
+          frame is not parquet-serializable (e.g. mixed-type object
+          columns raise arrow's TypeError/ValueError subclasses).
+    """
+    os.makedirs(dirname(pth), exist_ok=True)
+    try:
+        dfr.to_parquet(f'{pth}.parquet')
+        return f'{pth}.parquet'
+    except (ImportError, TypeError, ValueError):
+        if os.path.exists(f'{pth}.parquet'):
+            os.remove(f'{pth}.parquet')
+        dfr.to_csv(f'{pth}.csv.gz', compression='gzip')
+        return f'{pth}.csv.gz'
+
+
+def _write_table_pages(dfr, page_dir, tid, page_size):
+    """Write table as .js page chunks registering into window.stTablePages.
+
+    Each chunk is {"index": [...] | null, "data": [[...], ...]}; index is
+    null for a default range index, which the pager computes from the page.
+    """
+    os.makedirs(page_dir, exist_ok=True)
+    n_pages = -(-len(dfr) // page_size)
+    default_index = dfr.index.equals(pd.RangeIndex(len(dfr)))
+    for page in range(n_pages):
+        chunk = dfr.iloc[page*page_size:(page + 1)*page_size]
+        index = 'null' if default_index else \
+            _js_literal([str(x) for x in chunk.index])
+        data = chunk.to_json(
+            orient='values', double_precision=4, date_format='iso')
+        with open(join(page_dir, f'{page}.js'), 'w') as fh:
+            fh.write(
+                f'window.stTablePages["{tid}"][{page}] = '
+                f'{{"index":{index},"data":{data}}};\n'
+            )
+
+    return n_pages
+
+
+def _js_literal(val):
+    """Return val as json safe to embed in an html script element."""
+    return json.dumps(val, separators=(',', ':')).replace('</', '<\\/')
+
+
 def report_img_code(pths, hdr='Figure', desc='insert description', **params):
     """Structure html figure as report item."""
     meta = {"tags": ["hide_input"]}
@@ -12,18 +12,33 @@ Written by Samuel Thorpe
 # # Imports
 # -----------------------------------------------------|
 import argparse
+from logging import getLogger
 from sampy.utils.logger import init_log
 from st_experiment_template import BASE_DIR
 from st_experiment_template.experiment import Experiment
+from st_experiment_template.utils.watch import BlockWatcher
+logger = getLogger(__name__)
 
 
 # # Main Method
 # -----------------------------------------------------|
-def main(cfg_file, **kwrgs):
-    """Run main method."""
+def main(cfg_file, watch=False, **kwrgs):
+    """Run main method.
+
+    Note: with watch=True the experiment is kept alive after the first run
+          & changed block modules are hot reloaded and re-run.
+    """
     init_log(BASE_DIR)
     exp = Experiment(cfg_file, **kwrgs)
-    exp.run()
+    if not watch:
+        exp.run()
+        return exp
+
+    try:
+        exp.run()
+    except Exception:
+        logger.exception('run failed; fix & save a block module to re-run')
+    BlockWatcher(exp).watch()
 
     return exp
 
@@ -37,5 +52,9 @@ if __name__ == "__main__":  # pragma: no cover
         type=str,
         help='path to experiment cfg',
         default="st_experiment_template/cfg.yaml")
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help='hot reload & re-run changed blocks')
     args = parser.parse_args()
-    exp = main(args.cfg)
+    exp = main(args.cfg, watch=args.watch)
@@ -0,0 +1,312 @@
+"""
+Long-lived experiment service running spooled configs on warm workers.
+
+# NOTES
+# ----------------------------------------------------------------------------|
+Configs are submitted by dropping .yaml files into <spool>/incoming (write
+elsewhere then rename in, or use submit()). The service claims each config by
+atomic rename into <spool>/running and runs it on a pool of pre-warmed worker
+processes, which have already paid interpreter startup, heavy imports &
+init_log, and which keep imported block modules and recently loaded
+artifacts in memory across runs. On completion the config is moved to
+<spool>/done alongside a <name>.json result with status, timings & run id.
+
+Each claim reserves a unique run name by creating <spool>/runs/<name>; a
+config dropped under a name already in use (e.g. the same exp.yaml twice)
+runs as <name>-<ns>. Names from submit() are already unique.
+
+Runs are isolated by a per-run dir (<spool>/runs/<name>, holding the batch
+out_dir, report & trace, and pushed as a whole) and a fresh Experiment (and
+so fresh _data) per run; each worker runs one experiment at a time.
+Artifacts are cached by file identity, so hits across runs come from blocks
+loading the same file, e.g. an absolute path to a shared model, rather than
+per-run outputs. The cache is bounded by item count and by artifact file
+size. Cached objects are shared between runs, so blocks must not mutate
+objects returned by _load in place.
+
+If a worker process dies the pool is broken: configs which had started are
+marked failed, configs still queued are returned to incoming, and the pool
+is restarted & re-warmed on the next poll.
+
+Usage:
+
+    python -m st_experiment_template.service run/spool --workers 4 \\
+        --preload st_experiment_template.experiment.demo.example_block
+
+
+Written by Samuel Thorpe
+"""
+
+
+# # Imports
+# -----------------------------------------------------|
+import argparse
+import os
+from os.path import basename, exists, join, splitext
+import json
+import time
+import shutil
+import importlib
+import traceback
+from logging import getLogger
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from sampy.utils.logger import init_log
+from st_experiment_template import BASE_DIR
+from st_experiment_template.experiment import Block, Experiment
+from st_experiment_template.utils.threads import (
+    cpu_budget, set_thread_limits)
+
+
+# # Globals
+# -----------------------------------------------------|
+logger = getLogger(__name__)
+SPOOL_DIR = join(BASE_DIR, 'run', 'spool')
+SPOOL_SUBDIRS = ['incoming', 'running', 'done', 'runs']
+ARTIFACT_CACHE_ITEMS = 64
+ARTIFACT_CACHE_BYTES = 2 << 30
+STARTED_MARKER = '.started'
+
+
+# # Artifact Cache
+# -----------------------------------------------------|
+class ArtifactCache:
+    """Per-process LRU cache of loaded artifacts keyed on file identity."""
+
+    def __init__(self, max_items=ARTIFACT_CACHE_ITEMS,
+                 max_bytes=ARTIFACT_CACHE_BYTES):
+        """Initialize class.
+
+        Args:
+            max_items (int, optional): max number of cached artifacts
+            max_bytes (int, optional): max total file size of cached
+                                       artifacts; larger files are not cached
+        """
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.items = OrderedDict()
+        self.n_bytes = 0
+
+    def get(self, pth, loader):
+        """Return artifact at pth, calling loader(pth) on miss or change.
+
+        Note: keyed on device, inode, size & mtime, so any path to the same
+              unchanged file hits while rewritten files are reloaded.
+        """
+        stat = os.stat(pth)
+        key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        if key in self.items:
+            self.items.move_to_end(key)
+            return self.items[key]
+
+        dat = loader(pth)
+        if stat.st_size > self.max_bytes:
+            return dat
+
+        self.items[key] = dat
+        self.n_bytes += stat.st_size
+        while len(self.items) > self.max_items or \
+                self.n_bytes > self.max_bytes:
+            self.n_bytes -= self.items.popitem(last=False)[0][2]
+
+        return dat
+
+
+# # Service Class
+# -----------------------------------------------------|
+class ExperimentService:
+    """Run spooled experiment configs on a pool of warm workers."""
+
+    def __init__(self, spool_dir=SPOOL_DIR, workers=2, preload=(),
+                 interval=0.05):
+        """Initialize class.
+
+        Args:
+            spool_dir (str, optional): spool root directory
+            workers (int, optional): number of worker processes
+            preload (list, optional): modules imported by each worker
+            interval (float, optional): seconds between spool polls
+        """
+        self.spool_dir = spool_dir
+        self.workers = workers
+        self.preload = list(preload)
+        self.interval = interval
+        for sub in SPOOL_SUBDIRS:
+            os.makedirs(join(spool_dir, sub), exist_ok=True)
+        self.pending = {}
+        self.pool = self._start_pool()
+        logger.info(f'service ready: {workers} warm worker(s) on {spool_dir}')
+
+    def _start_pool(self):
+        """Return new worker pool, started & warmed before returning."""
+        pool = ProcessPoolExecutor(
+            self.workers,
+            initializer=_warm_worker,
+            initargs=(self.preload, max(1, cpu_budget() // self.workers))
+        )
+        for future in [pool.submit(_ping) for _ in range(self.workers)]:
+            future.result()
+
+        return pool
+
+    def serve(self):
+        """Poll the spool & dispatch configs until interrupted."""
+        try:
+            while True:
+                if not self.poll():
+                    time.sleep(self.interval)
+        except KeyboardInterrupt:
+            logger.info('stopping service')
+        finally:
+            self.close()
+
+    def poll(self):
+        """Claim & dispatch incoming configs; return number dispatched."""
+        incoming = join(self.spool_dir, 'incoming')
+        n_dispatched = 0
+        for fn in sorted(os.listdir(incoming)):
+            if splitext(fn)[-1] not in ('.yaml', '.yml'):
+                continue
+            name = self._reserve_name(splitext(fn)[0])
+            cfg_pth = join(self.spool_dir, 'running', f'{name}.yaml')
+            try:
+                os.rename(join(incoming, fn), cfg_pth)
+            except FileNotFoundError:  # claimed by another service
+                os.rmdir(join(self.spool_dir, 'runs', name))
+                continue
+            out_dir = join(self.spool_dir, 'runs', name, 'batch')
+            logger.info(f'dispatching {name}')
+            try:
+                future = self.pool.submit(
+                    _run_experiment, cfg_pth, out_dir, time.time())
+            except BrokenProcessPool:
+                logger.warning('worker pool broken; restarting workers')
+                self.pool.shutdown(wait=False)
+                self.pool = self._start_pool()
+                future = self.pool.submit(
+                    _run_experiment, cfg_pth, out_dir, time.time())
+            self.pending[name] = future
+            future.add_done_callback(
+                lambda fut, name=name, cfg_pth=cfg_pth:
+                    self._finish(name, cfg_pth, fut)
+            )
+            n_dispatched += 1
+
+        return n_dispatched
+
+    def close(self):
+        """Wait for running experiments & shut down workers."""
+        self.pool.shutdown(wait=True)
+
+    def _reserve_name(self, name):
+        """Return unique run name, reserved by creating its run dir."""
+        run_name = name
+        while True:
+            try:
+                os.mkdir(join(self.spool_dir, 'runs', run_name))
+                return run_name
+            except FileExistsError:
+                run_name = f'{name}-{time.time_ns()}'
+
+    def _finish(self, name, cfg_pth, future):
+        """Write run result json & move config to done (or requeue)."""
+        try:
+            run_dir = join(self.spool_dir, 'runs', name)
+            try:
+                result = future.result()
+            except BrokenProcessPool as exc:
+                if not exists(join(run_dir, STARTED_MARKER)):
+                    self._requeue(name, cfg_pth)
+                    return
+                result = dict(
+                    status='failed', error=f'worker process died: {exc!r}')
+            except Exception as exc:
+                result = dict(status='failed', error=repr(exc))
+            done = join(self.spool_dir, 'done')
+            with open(join(done, f'{name}.json.tmp'), 'w') as fh:
+                json.dump(dict(result, name=name), fh, indent=2)
+            os.replace(
+                join(done, f'{name}.json.tmp'), join(done, f'{name}.json'))
+            shutil.move(cfg_pth, join(done, basename(cfg_pth)))
+            logger.info(f'finished {name}: {result["status"]}')
+        except Exception:
+            logger.exception(f'failed to finish {name}')
+        finally:
+            self.pending.pop(name, None)
+
+    def _requeue(self, name, cfg_pth):
+        """Return a config which never started to incoming."""
+        shutil.rmtree(join(self.spool_dir, 'runs', name), ignore_errors=True)
+        os.rename(cfg_pth, join(self.spool_dir, 'incoming', f'{name}.yaml'))
+        logger.info(f'requeued {name}; its worker pool broke before it ran')
+
+
+# # Client helpers
+# -----------------------------------------------------|
+def submit(cfg_file, spool_dir=SPOOL_DIR, name=None):
+    """Atomically submit cfg_file to the spool; return run name."""
+    name = name or f'{splitext(basename(cfg_file))[0]}-{time.time_ns()}'
+    incoming = join(spool_dir, 'incoming')
+    os.makedirs(incoming, exist_ok=True)
+    shutil.copy(cfg_file, join(incoming, f'.{name}.tmp'))
+    os.rename(join(incoming, f'.{name}.tmp'), join(incoming, f'{name}.yaml'))
+
+    return name
+
+
+def result(name, spool_dir=SPOOL_DIR, timeout=None, interval=0.01):
+    """Return result dict of run name, waiting up to timeout seconds."""
+    pth = join(spool_dir, 'done', f'{name}.json')
+    tic = time.time()
+    while not exists(pth):
+        if timeout is not None and time.time() - tic > timeout:
+            raise TimeoutError(f'no result for {name} after {timeout}s')
+        time.sleep(interval)
+
+    return json.load(open(pth))
+
+
+# # Worker helpers
+# -----------------------------------------------------|
+def _warm_worker(preload, n_threads):
+    """Initialize worker: logging, native thread share, imports & cache."""
+    init_log(BASE_DIR)
+    set_thread_limits(n_threads)
+    for module in preload:
+        importlib.import_module(module)
+    Block._artifact_cache = ArtifactCache()
+
+
+def _ping():
+    """Return worker pid; used to start workers eagerly."""
+    return os.getpid()
+
+
+def _run_experiment(cfg_pth, out_dir, submitted):
+    """Run experiment cfg in this worker; return result dict."""
+    started = time.time()
+    open(join(os.path.dirname(out_dir), STARTED_MARKER), 'w').close()
+    out = dict(pid=os.getpid(), out_dir=out_dir, queued_s=started - submitted)
+    try:
+        exp = Experiment(cfg_pth, out_dir=out_dir)
+        out['setup_s'] = time.time() - started
+        exp.run()
+        out.update(status='ok', run_id=getattr(exp, 'run_id', None))
+    except Exception:
+        out.update(status='failed', error=traceback.format_exc())
+    out['duration_s'] = time.time() - started
+
+    return out
+
+
+# # Main Entry
+# -----------------------------------------------------|
+if __name__ == "__main__":  # pragma: no cover
+    parser = argparse.ArgumentParser(description='run experiment service')
+    parser.add_argument('spool', nargs='?', default=SPOOL_DIR)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--preload', nargs='*', default=[])
+    args = parser.parse_args()
+    init_log(BASE_DIR)
+    ExperimentService(args.spool, args.workers, args.preload).serve()
@@ -0,0 +1,335 @@
+"""
+Module housing the indexed SQLite registry of experiment runs.
+
+Each Experiment.run records its config, resolved block params, rng seeds, git
+commit, timings, published block metrics & artifact locations, so runs can be
+queried without walking run directories or unpickling outputs.
+
+# NOTES
+# ----------------------------------------------------------------------------|
+Params are flattened to dotted names prefixed by their block, e.g.
+ExampleVisBlock.plot_library or ExperimentParams.report.title, and stored as
+json text for equality filters. Metrics are float valued and indexed for
+ordering.
+
+Python usage:
+
+    reg = RunRegistry('.experiment/registry.sqlite')
+    reg.best('ScoreBlock.auc', **{'FitBlock.alpha': 0.1})
+    reg.runs(where={'FitBlock.alpha': 0.1}, metric='ScoreBlock.auc')
+    reg.compare([run_id0, run_id1])
+
+CLI usage:
+
+    python -m st_experiment_template.utils.registry list \
+        --where FitBlock.alpha=0.1 --metric ScoreBlock.auc
+    python -m st_experiment_template.utils.registry best ScoreBlock.auc
+    python -m st_experiment_template.utils.registry show <run_id>
+    python -m st_experiment_template.utils.registry compare <id0> <id1>
+
+
+Written by Samuel Thorpe
+"""
+
+
+# # Imports
+# -----------------------------------------------------|
+import argparse
+import json
+import os
+import sqlite3
+from os.path import dirname, join
+from uuid import uuid4
+from datetime import datetime
+from st_experiment_template import BASE_DIR
+
+
+# # Globals
+# -----------------------------------------------------|
+REGISTRY_PATH = join(BASE_DIR, '.experiment', 'registry.sqlite')
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY, started TEXT, duration REAL, status TEXT,
+    cfg_file TEXT, cfg TEXT, git_commit TEXT, git_dirty INTEGER,
+    out_dir TEXT
+);
+CREATE TABLE IF NOT EXISTS blocks (
+    run_id TEXT, idx INTEGER, name TEXT, module TEXT, params TEXT,
+    rng_seed INTEGER, duration REAL
+);
+CREATE TABLE IF NOT EXISTS params (
+    run_id TEXT, name TEXT, value TEXT
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id TEXT, name TEXT, value REAL
+);
+CREATE TABLE IF NOT EXISTS artifacts (
+    run_id TEXT, kind TEXT, location TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started);
+CREATE INDEX IF NOT EXISTS blocks_run ON blocks (run_id);
+CREATE INDEX IF NOT EXISTS params_name_value ON params (name, value, run_id);
+CREATE INDEX IF NOT EXISTS params_run ON params (run_id);
+CREATE INDEX IF NOT EXISTS metrics_name_value ON metrics (name, value, run_id);
+CREATE INDEX IF NOT EXISTS metrics_run ON metrics (run_id);
+CREATE INDEX IF NOT EXISTS artifacts_run ON artifacts (run_id);
+'''
+
+
+# # Registry Class
+# -----------------------------------------------------|
+class RunRegistry:
+    """SQLite registry of experiment runs."""
+
+    def __init__(self, db_pth=REGISTRY_PATH):
+        """Initialize class.
+
+        Args:
+            db_pth (str, optional): path to sqlite registry file
+        """
+        os.makedirs(dirname(db_pth) or '.', exist_ok=True)
+        self.db_pth = db_pth
+        self.con = sqlite3.connect(db_pth)
+        self.con.row_factory = sqlite3.Row
+        self.con.execute('PRAGMA journal_mode=WAL')
+        self.con.execute('PRAGMA synchronous=NORMAL')
+        self.con.executescript(SCHEMA)
+
+    def close(self):
+        """Close db connection."""
+        self.con.close()
+
+    # # Recording
+    # -----------------------------------------------------|
+    def record(self, run):
+        """Insert run record; return its run_id.
+
+        Args:
+            run (dict): with keys started, duration, status, cfg_file, cfg,
+                        git_commit, git_dirty, out_dir, blocks, metrics &
+                        artifacts. blocks is a list of dicts with keys idx,
+                        name, module, params & duration; metrics a dict of
+                        name -> float; artifacts a list of (kind, location).
+        """
+        run_id = run.get('run_id') or new_run_id()
+        params = flatten(run['cfg'].get('ExperimentParams', {}),
+                         'ExperimentParams')
+        for block in run['blocks']:
+            params.update(flatten(block['params'], block['name']))
+
+        with self.con:
+            self.con.execute(
+                'INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (run_id, run['started'], run['duration'], run['status'],
+                 run['cfg_file'], _dumps(run['cfg']), run['git_commit'],
+                 run['git_dirty'], run['out_dir'])
+            )
+            self.con.executemany(
+                'INSERT INTO blocks VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(run_id, x['idx'], x['name'], x['module'],
+                  _dumps(x['params']), x['params'].get('rng_seed'),
+                  x['duration']) for x in run['blocks']]
+            )
+            self.con.executemany(
+                'INSERT INTO params VALUES (?, ?, ?)',
+                [(run_id, key, _dumps(val)) for key, val in params.items()]
+            )
+            self.con.executemany(
+                'INSERT INTO metrics VALUES (?, ?, ?)',
+                [(run_id, key, val) for key, val in run['metrics'].items()]
+            )
+            self.con.executemany(
+                'INSERT INTO artifacts VALUES (?, ?, ?)',
+                [(run_id, kind, loc) for kind, loc in run['artifacts']]
+            )
+
+        return run_id
+
+    # # Querying
+    # -----------------------------------------------------|
+    def runs(self, where=None, metric=None, mode='max', status='ok',
+             limit=20):
+        """Return runs matching param filters, optionally ordered by metric.
+
+        Args:
+            where (dict, optional): dotted param name -> required value
+            metric (str, optional): metric to return & order by
+            mode (str, optional): max or min; metric ordering
+            status (str, optional): run status filter; None for any
+            limit (int, optional): max number of runs returned
+        """
+        sql = ['SELECT r.run_id, r.started, r.duration, r.status,'
+               ' r.git_commit']
+        args = []
+        sql.append(', m.value AS metric' if metric else ', NULL AS metric')
+        sql.append('FROM runs r')
+        if metric:
+            sql.append('JOIN metrics m ON m.run_id = r.run_id AND m.name = ?')
+            args.append(metric)
+        for idx, (key, val) in enumerate((where or {}).items()):
+            sql.append(
+                f'JOIN params p{idx} ON p{idx}.run_id = r.run_id'
+                f' AND p{idx}.name = ? AND p{idx}.value = ?'
+            )
+            args += [key, _dumps(val)]
+        if status is not None:
+            sql.append('WHERE r.status = ?')
+            args.append(status)
+        if metric:
+            order = 'ASC' if mode == 'min' else 'DESC'
+            sql.append(f'ORDER BY m.value {order}')
+        else:
+            sql.append('ORDER BY r.started DESC')
+        sql.append('LIMIT ?')
+        args.append(limit)
+
+        return [dict(x) for x in self.con.execute(' '.join(sql), args)]
+
+    def best(self, metric, mode='max', **where):
+        """Return the best run by metric among runs matching where."""
+        runs = self.runs(where=where, metric=metric, mode=mode, limit=1)
+        return runs[0] if runs else None
+
+    def get(self, run_id):
+        """Return full record of run_id."""
+        run = self.con.execute(
+            'SELECT * FROM runs WHERE run_id = ?', (run_id,)).fetchone()
+        if run is None:
+            raise KeyError(f'no run {run_id} in {self.db_pth}')
+        run = dict(run, cfg=json.loads(run['cfg']))
+        run['blocks'] = [
+            dict(x, params=json.loads(x['params'])) for x in self.con.execute(
+                'SELECT idx, name, module, params, rng_seed, duration'
+                ' FROM blocks WHERE run_id = ? ORDER BY idx', (run_id,))
+        ]
+        run['params'] = self._run_map('params', run_id, json.loads)
+        run['metrics'] = self._run_map('metrics', run_id)
+        run['artifacts'] = [tuple(x) for x in self.con.execute(
+            'SELECT kind, location FROM artifacts WHERE run_id = ?',
+            (run_id,))]
+
+        return run
+
+    def compare(self, run_ids):
+        """Return params & metrics which differ across run_ids.
+
+        Returns:
+            dict: {'params'|'metrics': {name: {run_id: value}}}
+        """
+        out = {}
+        for table, load in [('params', json.loads), ('metrics', None)]:
+            vals = {x: self._run_map(table, x, load) for x in run_ids}
+            names = sorted({key for x in vals.values() for key in x})
+            out[table] = {
+                name: {x: vals[x].get(name) for x in run_ids}
+                for name in names
+                if len({_dumps(vals[x].get(name)) for x in run_ids}) > 1
+            }
+
+        return out
+
+    def _run_map(self, table, run_id, load=None):
+        """Return name -> value dict of run_id rows in table."""
+        rows = self.con.execute(
+            f'SELECT name, value FROM {table} WHERE run_id = ?', (run_id,))
+        return {
+            name: load(val) if load else val for name, val in rows
+        }
+
+
+# # Helpers
+# -----------------------------------------------------|
+def new_run_id():
+    """Return new sortable unique run id."""
+    return f'{datetime.now().strftime("%Y%m%d-%H%M%S")}-{uuid4().hex[:8]}'
+
+
+def git_info(pth=BASE_DIR):
+    """Return (commit sha, dirty flag) of repo containing pth, if any."""
+    try:
+        import git
+        repo = git.Repo(pth, search_parent_directories=True)
+        return repo.head.commit.hexsha, int(repo.is_dirty())
+    except Exception:
+        return None, None
+
+
+def flatten(params, prefix):
+    """Return dotted key -> value dict of nested params dict."""
+    out = {}
+    for key, val in params.items():
+        if isinstance(val, dict) and val:
+            out.update(flatten(val, f'{prefix}.{key}'))
+        else:
+            out[f'{prefix}.{key}'] = val
+
+    return out
+
+
+def _dumps(val):
+    """Return canonical json text of val."""
+    return json.dumps(val, sort_keys=True, default=str)
+
+
+def _parse_where(items):
+    """Return where dict from list of name=value cli strings."""
+    where = {}
+    for item in items or []:
+        key, val = item.split('=', 1)
+        try:
+            where[key] = json.loads(val)
+        except json.JSONDecodeError:
+            where[key] = val
+
+    return where
+
+
+def _print_rows(rows):
+    """Print list of dicts as aligned table."""
+    if not rows:
+        print('no matching runs')
+        return
+    cols = list(rows[0])
+    widths = [max(len(str(x)), *(len(str(r[x])) for r in rows)) for x in cols]
+    print('  '.join(f'{c:<{w}}' for c, w in zip(cols, widths)))
+    for row in rows:
+        print('  '.join(f'{str(row[c]):<{w}}' for c, w in zip(cols, widths)))
+
+
+# # Main Entry
+# -----------------------------------------------------|
+def main(argv=None):
+    """Run registry cli."""
+    parser = argparse.ArgumentParser(description='query experiment runs')
+    parser.add_argument('--db', default=REGISTRY_PATH, help='registry path')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    for cmd in ['list', 'best']:
+        cmd_parser = sub.add_parser(cmd)
+        if cmd == 'best':
+            cmd_parser.add_argument('metric')
+        else:
+            cmd_parser.add_argument('--metric')
+            cmd_parser.add_argument('--limit', type=int, default=20)
+        cmd_parser.add_argument('--where', nargs='*', help='name=value')
+        cmd_parser.add_argument(
+            '--mode', default='max', choices=['max', 'min'])
+    sub.add_parser('show').add_argument('run_id')
+    sub.add_parser('compare').add_argument('run_ids', nargs='+')
+    args = parser.parse_args(argv)
+
+    reg = RunRegistry(args.db)
+    where = _parse_where(getattr(args, 'where', None))
+    if args.cmd == 'list':
+        _print_rows(reg.runs(where, args.metric, args.mode, limit=args.limit))
+    elif args.cmd == 'best':
+        best = reg.best(args.metric, args.mode, **where)
+        _print_rows([best] if best else [])
+    elif args.cmd == 'show':
+        print(json.dumps(reg.get(args.run_id), indent=2, default=str))
+    else:
+        print(json.dumps(reg.compare(args.run_ids), indent=2, default=str))
+    reg.close()
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
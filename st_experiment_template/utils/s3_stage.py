@@ -0,0 +1,262 @@
+"""
+Module housing concurrent S3 input staging into a local read-through cache.
+
+# NOTES
+# ----------------------------------------------------------------------------|
+Objects are downloaded with parallel ranged GETs into a content-addressed
+cache keyed on the object ETag, so re-runs (and container restarts with the
+cache dir mounted) only issue a HEAD request per input. Entries are evicted
+least-recently-used first once the cache exceeds max_bytes, except objects
+staged by this stager, whose paths & mmaps may still be in use. Use one
+stager per run.
+
+Inputs are specified as a mapping of name -> uri, or name -> dict with keys
+uri & mmap (bool) to return a read-only mmap handle instead of a path:
+
+    inputs:
+      raw: s3://bucket/path/raw.csv
+      emb:
+        uri: s3://bucket/path/emb.bin
+        mmap: True
+
+The cache index is not locked, so concurrent processes sharing a cache dir
+may re-download an object but will not corrupt it: downloads go to a unique
+temp file and all writes are atomic renames. The index is re-read & merged
+before each write, and eviction sizes the cache by scanning the objects dir,
+so objects missing from the index (e.g. from a lost index update) are still
+counted and evictable.
+
+
+Written by Samuel Thorpe
+"""
+
+
+# # Imports
+# -----------------------------------------------------|
+from logging import getLogger
+import os
+from os.path import basename, dirname, exists, join
+import json
+import mmap
+import hashlib
+import tempfile
+import threading
+from time import time
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+
+# # Globals
+# -----------------------------------------------------|
+logger = getLogger(__name__)
+PART_SIZE = 8 << 20
+MAX_BYTES = 50 << 30
+WORKERS = 16
+
+
+# # Stager Class
+# -----------------------------------------------------|
+class S3Stager:
+    """Stage S3 objects into a size-bounded local content-addressed cache."""
+
+    def __init__(self, cache_dir, max_bytes=MAX_BYTES, part_size=PART_SIZE,
+                 workers=WORKERS, client=None):
+        """Initialize class.
+
+        Args:
+            cache_dir (str): local cache directory
+            max_bytes (int, optional): cache size bound for eviction
+            part_size (int, optional): bytes per ranged GET
+            workers (int, optional): concurrent GET requests
+            client (optional): boto3 s3 client; created on first use if None
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.part_size = part_size
+        self.workers = workers
+        self._client = client
+        self._lock = threading.Lock()
+        self.staged = set()
+        os.makedirs(join(cache_dir, 'objects'), exist_ok=True)
+        self.index = self._read_index()
+
+    @property
+    def client(self):
+        """Return s3 client, creating the boto3 client on first use."""
+        if self._client is None:
+            import boto3
+            self._client = boto3.client('s3')
+
+        return self._client
+
+    # # Public methods
+    # -----------------------------------------------------|
+    def stage_all(self, inputs):
+        """Stage inputs concurrently; return dict of name -> path/handle."""
+        specs = {
+            name: spec if isinstance(spec, dict) else dict(uri=spec)
+            for name, spec in inputs.items()
+        }
+        n_workers = max(1, min(len(specs), self.workers))
+        with ThreadPoolExecutor(n_workers) as pool:
+            pths = dict(zip(
+                specs, pool.map(self.stage, [x['uri'] for x in specs.values()])
+            ))
+        self._evict(keep=self.staged)
+        self._write_index()
+
+        return {
+            name: open_mmap(pths[name]) if spec.get('mmap') else pths[name]
+            for name, spec in specs.items()
+        }
+
+    def stage(self, uri):
+        """Return local path of uri, downloading if missing or stale."""
+        bucket, key = split_uri(uri)
+        head = self.client.head_object(Bucket=bucket, Key=key)
+        etag, size = head['ETag'], head['ContentLength']
+        obj = _digest(etag, size)
+        pth = self._obj_pth(obj)
+
+        if exists(pth):
+            logger.info(f'cache hit {uri}')
+        else:
+            logger.info(f'staging {uri} ({size:,} bytes)')
+            self._download(bucket, key, etag, size, pth)
+        with self._lock:
+            self.staged.add(obj)
+            self.index[uri] = dict(
+                etag=etag, size=size, obj=obj, used=time())
+
+        return pth
+
+    # # Download helpers
+    # -----------------------------------------------------|
+    def _download(self, bucket, key, etag, size, pth):
+        """Download object with parallel ranged GETs, then atomic rename."""
+        fd, tmp_pth = tempfile.mkstemp(
+            prefix=f'{basename(pth)}.', suffix='.part', dir=dirname(pth))
+        ranges = [
+            (start, min(start + self.part_size, size) - 1)
+            for start in range(0, size, self.part_size)
+        ]
+        os.fchmod(fd, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            n_workers = max(1, min(len(ranges), self.workers))
+            with ThreadPoolExecutor(n_workers) as pool:
+                list(pool.map(
+                    lambda rng: self._get_range(bucket, key, etag, rng, fd),
+                    ranges
+                ))
+        except Exception:
+            os.close(fd)
+            os.remove(tmp_pth)
+            raise
+        os.close(fd)
+        os.replace(tmp_pth, pth)
+
+    def _get_range(self, bucket, key, etag, rng, fd):
+        """GET byte range rng of object (pinned to etag) & write to fd."""
+        resp = self.client.get_object(
+            Bucket=bucket, Key=key, IfMatch=etag,
+            Range=f'bytes={rng[0]}-{rng[1]}'
+        )
+        dat = resp['Body'].read()
+        if len(dat) != rng[1] - rng[0] + 1:
+            raise IOError(f'short read for s3://{bucket}/{key} range {rng}')
+        os.pwrite(fd, dat, rng[0])
+
+    # # Index & eviction helpers
+    # -----------------------------------------------------|
+    def _obj_pth(self, obj):
+        """Return local path of content-addressed object."""
+        return join(self.cache_dir, 'objects', obj)
+
+    def _read_index(self):
+        """Return cache index of uri -> entry, dropping missing objects."""
+        pth = join(self.cache_dir, 'index.json')
+        index = json.load(open(pth)) if exists(pth) else {}
+
+        return {
+            uri: x for uri, x in index.items()
+            if exists(self._obj_pth(x['obj']))
+        }
+
+    def _write_index(self):
+        """Merge with the on-disk index & atomically write cache index.
+
+        Note: entries written by other processes since this index was read
+              are kept; per uri the most recently used entry wins.
+        """
+        pth = join(self.cache_dir, 'index.json')
+        index = self._read_index()
+        for uri, entry in self.index.items():
+            if uri not in index or index[uri]['used'] <= entry['used']:
+                index[uri] = entry
+        self.index = {
+            uri: x for uri, x in index.items()
+            if exists(self._obj_pth(x['obj']))
+        }
+        fd, tmp_pth = tempfile.mkstemp(suffix='.tmp', dir=self.cache_dir)
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(self.index, fh)
+        os.replace(tmp_pth, pth)
+
+    def _evict(self, keep=()):
+        """Remove least recently used objects until under max_bytes.
+
+        Note: sizes come from scanning the objects dir; objects without an
+              index entry are aged by file mtime. Objects in keep (i.e. those
+              staged by this stager) and in-progress .part downloads are
+              never evicted.
+        """
+        used = {}
+        for entry in self.index.values():
+            used[entry['obj']] = max(entry['used'], used.get(entry['obj'], 0))
+        objects = {}
+        for entry in os.scandir(join(self.cache_dir, 'objects')):
+            if entry.name.endswith('.part'):
+                continue
+            stat = entry.stat()
+            objects[entry.name] = (
+                used.get(entry.name, stat.st_mtime), stat.st_size)
+        total = sum(x[1] for x in objects.values())
+
+        for obj, (_, size) in sorted(objects.items(), key=lambda x: x[1][0]):
+            if total <= self.max_bytes:
+                break
+            if obj in keep:
+                continue
+            logger.info(f'evicting {obj}')
+            try:
+                os.remove(self._obj_pth(obj))
+            except FileNotFoundError:
+                pass  # evicted by another process
+            total -= size
+            self.index = {
+                uri: x for uri, x in self.index.items() if x['obj'] != obj}
+
+
+# # Helpers
+# -----------------------------------------------------|
+def split_uri(uri):
+    """Return (bucket, key) of s3://bucket/key uri."""
+    parsed = urlparse(uri)
+    if parsed.scheme != 's3' or not parsed.netloc:
+        raise ValueError(f'invalid s3 uri: {uri}')
+
+    return parsed.netloc, parsed.path.lstrip('/')
+
+
+def open_mmap(pth):
+    """Return read-only mmap handle over file at pth; b'' if empty."""
+    if os.path.getsize(pth) == 0:
+        return b''
+    with open(pth, 'rb') as fh:
+        return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _digest(etag, size):
+    """Return content address for an object's etag & size."""
+    return hashlib.sha256(f'{etag}-{size}'.encode()).hexdigest()
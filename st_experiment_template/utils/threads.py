@@ -0,0 +1,113 @@
+"""
+Module housing native (BLAS/OpenMP) thread pool budgeting helpers.
+
+# NOTES
+# ----------------------------------------------------------------------------|
+Limits are applied at runtime to already loaded MKL/OpenBLAS/OpenMP pools via
+threadpoolctl, and via the usual env vars for libraries loaded later and for
+child processes. Native pools are process-wide, so concurrently running
+blocks in one process necessarily share a single limit. A persistent limit
+set by set_thread_limits (e.g. a service worker's share of the machine) also
+caps cpu_budget, so budgets split within that process stay inside it.
+
+
+Written by Samuel Thorpe
+"""
+
+
+# # Imports
+# -----------------------------------------------------|
+from logging import getLogger
+import os
+from contextlib import contextmanager
+try:
+    from threadpoolctl import threadpool_info, threadpool_limits
+except ImportError:  # pragma: no cover
+    threadpool_info = threadpool_limits = None
+
+
+# # Globals
+# -----------------------------------------------------|
+logger = getLogger(__name__)
+THREAD_ENV_VARS = [
+    'OMP_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'MKL_NUM_THREADS',
+    'BLIS_NUM_THREADS',
+    'VECLIB_MAXIMUM_THREADS',
+    'NUMEXPR_NUM_THREADS',
+]
+_process_budget = None
+
+
+# # Thread budgeting
+# -----------------------------------------------------|
+def cpu_budget():
+    """Return number of cpus available to this process.
+
+    Note: capped by any persistent set_thread_limits budget.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        n_cpus = len(os.sched_getaffinity(0))
+    else:
+        n_cpus = os.cpu_count() or 1
+
+    return min(n_cpus, _process_budget) if _process_budget else n_cpus
+
+
+def split_budget(budget, requested):
+    """Return per-block thread counts for concurrently running blocks.
+
+    Args:
+        budget (int): total native threads available
+        requested (list): per-block requested threads; None for auto
+
+    Note: explicit requests are capped at budget; the remainder is split
+          evenly across auto blocks, each getting at least one thread.
+    """
+    fixed = sum(min(x, budget) for x in requested if x is not None)
+    n_auto = sum(x is None for x in requested)
+    share = max(1, (budget - fixed) // n_auto) if n_auto else 0
+
+    return [share if x is None else min(x, budget) for x in requested]
+
+
+@contextmanager
+def thread_limits(n_threads):
+    """Limit native thread pools & thread env vars to n_threads."""
+    saved = {x: os.environ.get(x) for x in THREAD_ENV_VARS}
+    os.environ.update({x: str(n_threads) for x in THREAD_ENV_VARS})
+    try:
+        if threadpool_limits is None:
+            logger.warning('threadpoolctl not installed; only env vars set')
+            yield
+        else:
+            with threadpool_limits(limits=n_threads):
+                yield
+    finally:
+        for key, val in saved.items():
+            if val is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = val
+
+
+def set_thread_limits(n_threads):
+    """Persistently limit native thread pools, env vars & cpu_budget."""
+    global _process_budget
+    _process_budget = n_threads
+    os.environ.update({x: str(n_threads) for x in THREAD_ENV_VARS})
+    if threadpool_limits is not None:
+        threadpool_limits(limits=n_threads)
+
+
+def native_threads():
+    """Return dict of loaded native pool -> current num threads."""
+    if threadpool_info is None:
+        return {}
+
+    return {
+        f'{x["internal_api"]}:{os.path.basename(x["filepath"])}':
+            x['num_threads']
+        for x in threadpool_info()
+    }
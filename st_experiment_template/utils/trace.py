@@ -0,0 +1,194 @@
+"""
+Module housing lightweight span tracing for experiment runs.
+
+Spans are recorded as Chrome trace-event "complete" events and written out as
+a json file viewable in chrome://tracing or https://ui.perfetto.dev.
+
+# NOTES
+# ----------------------------------------------------------------------------|
+Usage, either as a context manager or a decorator:
+
+    from st_experiment_template.utils.trace import span
+
+    with span('fit', cat='model', n_iter=10):
+        ...
+
+    @span('featurize')
+    def featurize(self):
+        ...
+
+When tracing is disabled (the default) entering a span is a single attribute
+check, so spans can be left in place in block code.
+
+Spans opened inside an asyncio task are recorded on a pseudo thread per task
+(named after the task), since complete events on one thread must nest and
+concurrently running tasks' spans overlap.
+
+
+Written by Samuel Thorpe
+"""
+
+
+# # Imports
+# -----------------------------------------------------|
+from logging import getLogger
+import os
+from os.path import dirname
+import json
+import asyncio
+import threading
+import weakref
+from functools import wraps
+from inspect import iscoroutinefunction
+from time import perf_counter_ns
+
+
+# # Globals
+# -----------------------------------------------------|
+logger = getLogger(__name__)
+TASK_TID_BASE = 1 << 40
+
+
+# # Tracer Class
+# -----------------------------------------------------|
+class Tracer:
+    """Collect trace events for a single run."""
+
+    def __init__(self):
+        """Initialize class."""
+        self.enabled = False
+        self.events = []
+        self._t0 = perf_counter_ns()
+        self._task_tids = weakref.WeakKeyDictionary()
+        self._tid_names = {}
+
+    def start(self):
+        """Clear any collected events and enable tracing."""
+        self.events = []
+        self._t0 = perf_counter_ns()
+        self._task_tids = weakref.WeakKeyDictionary()
+        self._tid_names = {}
+        self.enabled = True
+
+    def stop(self):
+        """Disable tracing."""
+        self.enabled = False
+
+    def add(self, name, cat, start_ns, end_ns, args):
+        """Record a complete (ph=X) event."""
+        self.events.append(dict(
+            name=name,
+            cat=cat,
+            ph='X',
+            ts=(start_ns - self._t0) / 1e3,
+            dur=(end_ns - start_ns) / 1e3,
+            pid=os.getpid(),
+            tid=self._tid(),
+            args=args
+        ))
+
+    def _tid(self):
+        """Return current thread ident, or a pseudo tid per asyncio task."""
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:  # no running loop
+            task = None
+        if task is None:
+            return threading.get_ident()
+
+        if task not in self._task_tids:
+            tid = TASK_TID_BASE + len(self._tid_names)
+            self._task_tids[task] = tid
+            self._tid_names[tid] = f'task {task.get_name()}'
+
+        return self._task_tids[task]
+
+    def export(self, pth):
+        """Write collected events as chrome trace-event json."""
+        logger.info(f'writing trace {pth}')
+        os.makedirs(dirname(pth) or '.', exist_ok=True)
+        threads = {(x['pid'], x['tid']) for x in self.events}
+        meta = [
+            dict(name='thread_name', ph='M', pid=pid, tid=tid,
+                 args=dict(name=self._tid_names.get(tid) or _thread_name(tid)))
+            for pid, tid in threads
+        ]
+        with open(pth, 'w') as fh:
+            json.dump(
+                dict(traceEvents=meta + self.events, displayTimeUnit='ms'),
+                fh, default=str
+            )
+
+
+tracer = Tracer()
+
+
+# # Span Class
+# -----------------------------------------------------|
+class span:
+    """Trace span usable as a context manager or decorator."""
+
+    __slots__ = ('name', 'cat', 'args', '_start')
+
+    def __init__(self, name, cat='experiment', **args):
+        """Initialize class.
+
+        Args:
+            name (str): span name shown in the timeline
+            cat (str, optional): span category
+            **args: extra key/vals attached to the event
+        """
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self._start = None
+
+    def __enter__(self):
+        """Start span."""
+        if tracer.enabled:
+            self._start = perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        """Close span & record event."""
+        if self._start is not None:
+            args = self.args
+            if exc_type is not None:
+                args = dict(args, error=exc_type.__name__)
+            tracer.add(
+                self.name, self.cat, self._start, perf_counter_ns(), args)
+            self._start = None
+
+    def __call__(self, func):
+        """Wrap func so each call is traced in a fresh span."""
+        name, cat, args = self.name, self.cat, self.args
+
+        if iscoroutinefunction(func):
+            @wraps(func)
+            async def ainner(*a, **kw):
+                if not tracer.enabled:
+                    return await func(*a, **kw)
+                with span(name, cat, **args):
+                    return await func(*a, **kw)
+
+            return ainner
+
+        @wraps(func)
+        def inner(*a, **kw):
+            if not tracer.enabled:
+                return func(*a, **kw)
+            with span(name, cat, **args):
+                return func(*a, **kw)
+
+        return inner
+
+
+# # Helpers
+# -----------------------------------------------------|
+def _thread_name(tid):
+    """Return name of thread with ident tid if still alive."""
+    for thread in threading.enumerate():
+        if thread.ident == tid:
+            return thread.name
+
+    return str(tid)
@@ -0,0 +1,108 @@
+"""
+Module housing watch mode: hot reload & re-run of changed experiment blocks.
+
+# NOTES
+# ----------------------------------------------------------------------------|
+The block modules listed in the experiment cfg are polled for changes. On
+save the changed modules are reloaded with importlib.reload and the
+experiment is re-run from the first block defined in a changed module,
+keeping the data of upstream blocks in memory. Blocks run in sequence and
+share _data, so every block after a changed block is treated as downstream
+and is recomputed, i.e. CheckRunBlock cached outputs are not reused.
+
+Only the modules named in the cfg are reloaded; edits to helper modules they
+import require a restart.
+
+
+Written by Samuel Thorpe
+"""
+
+
+# # Imports
+# -----------------------------------------------------|
+from logging import getLogger
+import os
+import sys
+import time
+import importlib
+import importlib.util
+
+
+# # Globals
+# -----------------------------------------------------|
+logger = getLogger(__name__)
+
+
+# # Watcher Class
+# -----------------------------------------------------|
+class BlockWatcher:
+    """Watch an experiment's block modules & re-run blocks on change."""
+
+    def __init__(self, exp, interval=0.5):
+        """Initialize class.
+
+        Args:
+            exp (Experiment): experiment which has already been run
+            interval (float, optional): seconds between polls
+        """
+        self.exp = exp
+        self.interval = interval
+        self.module_idxs = {}
+        for idx, params in enumerate(exp.cfg.values()):
+            self.module_idxs.setdefault(params['module'], []).append(idx)
+        self.mtimes = {x: self._mtime(x) for x in self.module_idxs}
+
+    def watch(self):
+        """Poll for changed block modules until interrupted."""
+        logger.info(f'watching {list(self.module_idxs)}; ctrl-c to exit')
+        try:
+            while True:
+                time.sleep(self.interval)
+                self.check()
+        except KeyboardInterrupt:
+            logger.info('stopped watching')
+
+    def check(self):
+        """Reload changed modules & re-run; return the re-run start idx."""
+        changed = self.poll()
+        if not changed:
+            return None
+
+        try:
+            for module in changed:
+                logger.info(f'reloading {module}')
+                if module in sys.modules:
+                    importlib.reload(sys.modules[module])
+                else:
+                    importlib.import_module(module)
+            start_idx = min(x for y in changed for x in self.module_idxs[y])
+            tic = time.perf_counter()
+            self.exp.rerun(start_idx)
+            logger.info(f're-ran in {time.perf_counter() - tic:.2f}s')
+        except Exception:
+            logger.exception('re-run failed; waiting for next change')
+            return None
+
+        return start_idx
+
+    def poll(self):
+        """Return list of block modules modified since the last poll."""
+        changed = []
+        for module, mtime in self.mtimes.items():
+            new_mtime = self._mtime(module)
+            if new_mtime != mtime:
+                self.mtimes[module] = new_mtime
+                changed.append(module)
+
+        return changed
+
+    @staticmethod
+    def _mtime(module):
+        """Return mtime of module's source file; None if unavailable."""
+        src = getattr(sys.modules.get(module), '__file__', None)
+        if src is None:
+            src = importlib.util.find_spec(module).origin
+        try:
+            return os.stat(src).st_mtime_ns
+        except OSError:
+            return None
@@ -0,0 +1,191 @@
+"""
+Module housing async block unit tests.
+
+# NOTES
+# ----------------------------------------------------------------------------|
+Blocks fetch from a local stand-in http server which records the peak number
+of in-flight requests.
+
+
+By Samuel Thorpe
+"""
+
+
+# # Imports
+# -----------------------------------------------------|
+import asyncio
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os.path import dirname, join
+from urllib.request import urlopen
+from st_experiment_template.experiment import Block, Experiment
+
+
+# # Globals
+# -----------------------------------------------------|
+test_dir = dirname(__file__)
+N_REQUESTS = 20
+MAX_CONCURRENCY = 5
+
+
+# # Local stand-in server
+# -----------------------------------------------------|
+class SlowHandler(BaseHTTPRequestHandler):
+    """Handler which sleeps briefly & tracks in-flight requests."""
+
+    lock = threading.Lock()
+    in_flight = 0
+    peak = 0
+
+    def do_GET(self):
+        """Respond with the request path after a short delay."""
+        with self.lock:
+            SlowHandler.in_flight += 1
+            SlowHandler.peak = max(SlowHandler.peak, SlowHandler.in_flight)
+        time.sleep(0.05)
+        with self.lock:
+            SlowHandler.in_flight -= 1
+        body = self.path.encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        """Silence request logging."""
+        pass
+
+
+# # Test blocks
+# -----------------------------------------------------|
+class AsyncFetchBlock(Block):
+    """Async block fetching N_REQUESTS paths from the local server."""
+
+    async def run(self):
+        """Run main method."""
+        loop = asyncio.get_running_loop()
+
+        async def fetch(idx):
+            url = f'{self._url}/{self.__class__.__name__}/{idx}'
+            resp = await self._limit(loop.run_in_executor(None, urlopen, url))
+            return resp.read().decode()
+
+        self._data[self.__class__.__name__] = await asyncio.gather(
+            *[fetch(idx) for idx in range(N_REQUESTS)])
+
+
+class AsyncFetchBlock2(AsyncFetchBlock):
+    """Second async block to run alongside the first."""
+
+    pass
+
+
+class SyncBlock(Block):
+    """Sync block consuming the async blocks outputs."""
+
+    def run(self):
+        """Run main method."""
+        keys = ['AsyncFetchBlock', 'AsyncFetchBlock2']
+        self._data['total'] = sum(len(self._data[x]) for x in keys)
+
+
+class FailingBlock(Block):
+    """Async block which fails after a short delay."""
+
+    async def run(self):
+        """Run main method."""
+        await asyncio.sleep(0.01)
+        self.fail('failed')
+
+
+class SlowBlock(Block):
+    """Async block recording whether it was cancelled."""
+
+    cancelled = False
+
+    async def run(self):
+        """Run main method."""
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            SlowBlock.cancelled = True
+            raise
+
+
+# # Main Class
+# -----------------------------------------------------|
+class TestAsyncBlocks(unittest.TestCase):
+    """Test async blocks on the shared experiment event loop."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start local stand-in server."""
+        Experiment.out_dir = join(test_dir, 'run', 'batch')
+        cls.tmp = tempfile.TemporaryDirectory()
+        Experiment.state_dir = cls.tmp.name
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), SlowHandler)
+        cls.url = f'http://127.0.0.1:{cls.server.server_port}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop local stand-in server."""
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.tmp.cleanup()
+
+    def setUp(self):
+        """Reset server counters."""
+        SlowHandler.in_flight = SlowHandler.peak = 0
+
+    def _run_cfg(self, gather, blocks=None):
+        """Write & run experiment cfg with the async test blocks."""
+        blocks = blocks or ['AsyncFetchBlock', 'AsyncFetchBlock2', 'SyncBlock']
+        lines = [
+            'ExperimentParams:',
+            '  asyncio:',
+            f'    max_concurrency: {MAX_CONCURRENCY}',
+            f'    gather: {gather}',
+        ]
+        for name in blocks:
+            lines += [f'{name}:', f'  module: {__name__}']
+            lines += [f'  url: {self.url}']
+        with tempfile.TemporaryDirectory() as tmp:
+            cfg = join(tmp, 'cfg.yaml')
+            with open(cfg, 'w') as fh:
+                fh.write('\n'.join(lines))
+            exp = Experiment(cfg)
+            exp.run()
+
+        return exp
+
+    def test_async_blocks(self):
+        """Test async blocks run & respect the concurrency limiter."""
+        exp = self._run_cfg(gather=False)
+        assert exp.data['total'] == 2*N_REQUESTS
+        assert exp.data['AsyncFetchBlock'][0] == '/AsyncFetchBlock/0'
+        assert 1 < SlowHandler.peak <= MAX_CONCURRENCY
+
+    def test_gathered_async_blocks(self):
+        """Test consecutive async blocks share the limiter when gathered."""
+        exp = self._run_cfg(gather=True)
+        assert exp.data['total'] == 2*N_REQUESTS
+        assert SlowHandler.peak <= MAX_CONCURRENCY
+
+    def test_gathered_failure_cancels(self):
+        """Test a failing gathered block cancels its siblings."""
+        SlowBlock.cancelled = False
+        tic = time.perf_counter()
+        with self.assertRaises(Exception):
+            self._run_cfg(gather=True, blocks=['SlowBlock', 'FailingBlock'])
+        assert SlowBlock.cancelled
+        assert time.perf_counter() - tic < 2
+
+
+# # Main Entry
+# -----------------------------------------------------|
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+"""
+Module housing data-source block unit tests.
+
+# NOTES
+# ----------------------------------------------------------------------------|
+
+
+By Samuel Thorpe
+"""
+
+
+# # Imports
+# -----------------------------------------------------|
+import os
+import tempfile
+import unittest
+from unittest import mock
+from os.path import join
+import numpy as np
+import pandas as pd
+from st_experiment_template.experiment import data_source_block
+from st_experiment_template.experiment.data_source_block import (
+    CsvSourceBlock, JsonSourceBlock, _byte_ranges)
+
+
+# # Helpers
+# -----------------------------------------------------|
+def make_dfr(n_rows, offset=0):
+    """Return test frame with int, float & string columns."""
+    idx = np.arange(offset, offset + n_rows)
+    return pd.DataFrame(dict(
+        user_id=idx,
+        score=idx / 7,
+        label=[f'label-{x % 5}' for x in idx]
+    ))
+
+
+def assert_loaded_equal(dfr, expected):
+    """Assert memory-mapped categorical dfr equals in-memory expected."""
+    pd.testing.assert_frame_equal(
+        dfr.astype(dict(label=object)).copy(),
+        expected.astype(dict(label=object)))
+
+
+# # Main Class
+# -----------------------------------------------------|
+class TestDataSourceBlock(unittest.TestCase):
+    """Test columnar caching data-source blocks."""
+
+    def setUp(self):
+        """Create temp dir & point blocks at it."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data = {}
+        for block in [CsvSourceBlock, JsonSourceBlock]:
+            block._data = self.data
+            block._out_dir = join(self.tmp.name, block.__name__)
+
+    def tearDown(self):
+        """Remove temp dir."""
+        self.tmp.cleanup()
+
+    def _write_csvs(self, n_files=2, n_rows=100):
+        """Write n_files csv inputs; return their concatenation."""
+        dfrs = [make_dfr(n_rows, idx * n_rows) for idx in range(n_files)]
+        for idx, dfr in enumerate(dfrs):
+            dfr.to_csv(join(self.tmp.name, f'{idx}.csv'), index=False)
+
+        return pd.concat(dfrs, ignore_index=True)
+
+    def _run(self, block=CsvSourceBlock, **params):
+        """Run block & return its loaded DataFrame."""
+        params = dict(dict(
+            glob=join(self.tmp.name, '*.csv'), key='raw', workers=1,
+            chunksize=30), **params)
+        block(**params).run()
+
+        return self.data['raw']()
+
+    def test_csv_round_trip(self):
+        """Test csv inputs load back equal with categorical strings."""
+        expected = self._write_csvs()
+        dfr = self._run()
+        assert isinstance(dfr['label'].dtype, pd.CategoricalDtype)
+        assert list(dfr['label'].cat.categories) == \
+            [f'label-{x}' for x in range(5)]
+        assert_loaded_equal(dfr, expected)
+
+    def test_json_lines_round_trip(self):
+        """Test json lines inputs load back equal."""
+        expected = make_dfr(100)
+        pth = join(self.tmp.name, 'raw.jsonl')
+        expected.to_json(pth, orient='records', lines=True)
+        dfr = self._run(JsonSourceBlock, glob=pth, split_mb=0.001,
+                        read_kw=dict(lines=True))
+        assert_loaded_equal(dfr, expected)
+
+    def test_split_ranges(self):
+        """Test large files are parsed as line-aligned byte ranges."""
+        expected = self._write_csvs(n_files=1, n_rows=2000)
+        pth = join(self.tmp.name, '0.csv')
+        rngs = _byte_ranges(pth, 4096)
+        assert len(rngs) > 2
+        assert rngs[0][0] == 0 and rngs[-1][1] == os.path.getsize(pth)
+        with open(pth, 'rb') as fh:
+            for start, _ in rngs[1:]:
+                fh.seek(start - 1)
+                assert fh.read(1) == b'\n'
+
+        dfr = self._run(split_mb=4096 / (1 << 20), workers=2)
+        assert_loaded_equal(dfr, expected)
+
+    def test_cache_hit(self):
+        """Test re-runs on unchanged inputs skip parsing."""
+        self._write_csvs()
+        self._run()
+        with mock.patch.object(
+                data_source_block, '_parse_to_parts',
+                wraps=data_source_block._parse_to_parts) as parse:
+            self._run()
+        parse.assert_not_called()
+
+    def test_rebuild_on_change(self):
+        """Test changed inputs trigger a rebuild."""
+        self._write_csvs()
+        assert len(self._run()) == 200
+        pth = join(self.tmp.name, '1.csv')
+        make_dfr(50).to_csv(pth, index=False)
+        os.utime(pth, (1, 1))
+        assert len(self._run()) == 150
+        cache_root = join(CsvSourceBlock._out_dir, 'cache')
+        assert len(os.listdir(cache_root)) == 1
+
+    def test_index_col(self):
+        """Test read_kw index_col is cached & restored, also when split."""
+        expected = self._write_csvs(n_files=1, n_rows=2000)
+        dfr = self._run(read_kw=dict(index_col='user_id'),
+                        split_mb=4096 / (1 << 20))
+        assert list(dfr.columns) == ['score', 'label']
+        assert dfr.index.name == 'user_id'
+        assert_loaded_equal(dfr.reset_index(), expected)
+
+    def test_mismatched_columns(self):
+        """Test inputs with mismatched columns raise."""
+        self._write_csvs()
+        make_dfr(10).drop(columns='score').to_csv(
+            join(self.tmp.name, '2.csv'), index=False)
+        with self.assertRaises(ValueError):
+            self._run()
+
+
+# # Main Entry
+# -----------------------------------------------------|
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+"""
+Module housing run registry unit tests.
+
+# NOTES
+# ----------------------------------------------------------------------------|
+
+
+By Samuel Thorpe
+"""
+
+
+# # Imports
+# -----------------------------------------------------|
+import tempfile
+import unittest
+from os.path import join
+from time import perf_counter
+from st_experiment_template.experiment import Block, Experiment
+from st_experiment_template.utils.registry import RunRegistry, main
+
+
+# # Globals
+# -----------------------------------------------------|
+N_RUNS = 10000
+
+
+# # Helpers
+# -----------------------------------------------------|
+def fake_run(idx):
+    """Return fake run record with param alpha & metric auc."""
+    opts = dict(solver='lbfgs')
+    params = dict(module='fit_block', alpha=idx % 10, opts=opts)
+    return dict(
+        started=f'2025-01-01T00:00:{idx:05d}',
+        duration=1.0,
+        status='ok' if idx % 100 else 'failed',
+        cfg_file='cfg.yaml',
+        cfg=dict(ExperimentParams=dict(block_rng_seed=True), FitBlock=params),
+        git_commit='abc123',
+        git_dirty=0,
+        out_dir='run/batch',
+        blocks=[dict(idx=0, name='FitBlock', module='fit_block',
+                     params=params, duration=0.5)],
+        metrics={'FitBlock.auc': (idx * 7919) % N_RUNS / N_RUNS},
+        artifacts=[('block', 'run/batch/0-FitBlock')]
+    )
+
+
+class RegisteredBlock(Block):
+    """Block publishing a metric."""
+
+    def run(self):
+        """Run main method."""
+        self._data['done'] = True
+        self._metric('auc', 0.5)
+
+
+# # Main Class
+# -----------------------------------------------------|
+class TestRegistry(unittest.TestCase):
+    """Test recording & querying runs."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Populate registry with N_RUNS fake runs."""
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.db_pth = join(cls.tmp.name, 'registry.sqlite')
+        cls.reg = RunRegistry(cls.db_pth)
+        cls.run_ids = [cls.reg.record(fake_run(x)) for x in range(N_RUNS)]
+
+    @classmethod
+    def tearDownClass(cls):
+        """Remove registry."""
+        cls.reg.close()
+        cls.tmp.cleanup()
+
+    def test_best(self):
+        """Test best run query by param filter is correct & fast."""
+        tic = perf_counter()
+        best = self.reg.best('FitBlock.auc', **{'FitBlock.alpha': 3})
+        assert perf_counter() - tic < 1
+        runs = [fake_run(x) for x in range(N_RUNS)]
+        expected = max(
+            (x for x in runs if x['blocks'][0]['params']['alpha'] == 3
+             and x['status'] == 'ok'),
+            key=lambda x: x['metrics']['FitBlock.auc'])
+        assert best['metric'] == expected['metrics']['FitBlock.auc']
+
+    def test_runs_filter(self):
+        """Test nested param filters & status."""
+        where = {'FitBlock.opts.solver': 'lbfgs', 'FitBlock.alpha': 0}
+        runs = self.reg.runs(where, limit=N_RUNS)
+        assert len(runs) == N_RUNS // 10 - N_RUNS // 100
+        assert self.reg.runs(where, status=None, limit=1)[0]['status']
+
+    def test_get_and_compare(self):
+        """Test full run record & diff across runs."""
+        run = self.reg.get(self.run_ids[1])
+        assert run['params']['FitBlock.alpha'] == 1
+        assert run['blocks'][0]['params']['opts'] == dict(solver='lbfgs')
+        diff = self.reg.compare(self.run_ids[1:3])
+        assert set(diff['params']) == {'FitBlock.alpha'}
+        assert set(diff['metrics']) == {'FitBlock.auc'}
+
+    def test_cli(self):
+        """Test cli commands run."""
+        main(['--db', self.db_pth, 'best', 'FitBlock.auc',
+              '--where', 'FitBlock.alpha=3'])
+        main(['--db', self.db_pth, 'show', self.run_ids[0]])
+
+
+class TestExperimentRegistry(unittest.TestCase):
+    """Test experiment runs are registered without masking outcomes."""
+
+    def _run_cfg(self, tmp, db_pth):
+        """Write & run experiment cfg registering to db_pth."""
+        cfg = join(tmp, 'cfg.yaml')
+        with open(cfg, 'w') as fh:
+            fh.write('\n'.join([
+                'ExperimentParams:',
+                '  registry:',
+                f'    path: {db_pth}',
+                'RegisteredBlock:',
+                f'  module: {__name__}',
+            ]))
+        exp = Experiment(cfg, out_dir=join(tmp, 'batch'))
+        exp.run()
+
+        return exp
+
+    def test_registered(self):
+        """Test run is recorded with its metrics."""
+        with tempfile.TemporaryDirectory() as tmp:
+            db_pth = join(tmp, 'registry.sqlite')
+            exp = self._run_cfg(tmp, db_pth)
+            reg = RunRegistry(db_pth)
+            assert reg.get(exp.run_id)['metrics'] == {
+                'RegisteredBlock.auc': 0.5}
+            reg.close()
+
+    def test_register_failure(self):
+        """Test a registry failure does not fail the run."""
+        with tempfile.TemporaryDirectory() as tmp:
+            open(join(tmp, 'file'), 'w').close()
+            exp = self._run_cfg(tmp, join(tmp, 'file', 'registry.sqlite'))
+            assert exp.data['done'] is True
+            assert not hasattr(exp, 'run_id')
+
+
+# # Main Entry
+# -----------------------------------------------------|
+if __name__ == "__main__":
+    unittest.main()
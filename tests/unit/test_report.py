@@ -0,0 +1,123 @@
+"""
+Module housing report item unit tests.
+
+# NOTES
+# ----------------------------------------------------------------------------|
+
+
+By Samuel Thorpe
+"""
+
+
+# # Imports
+# -----------------------------------------------------|
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+from os.path import join
+import numpy as np
+import pandas as pd
+from st_experiment_template.experiment.report import report_large_table
+
+
+# # Helpers
+# -----------------------------------------------------|
+def make_dfr(n_rows):
+    """Return test frame with numeric & string columns."""
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(dict(
+        x=rng.normal(size=n_rows),
+        label=[f'<b>&{idx % 7}' for idx in range(n_rows)]
+    ))
+
+
+def read_page(pth):
+    """Return json payload of a .js page chunk."""
+    src = open(pth).read()
+    return json.loads(src.split(' = ', 1)[1].rstrip(';\n'))
+
+
+# # Main Class
+# -----------------------------------------------------|
+class TestReportLargeTable(unittest.TestCase):
+    """Test summarized, paginated large table report items."""
+
+    def setUp(self):
+        """Create temp out_dir."""
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """Remove temp out_dir."""
+        self.tmp.cleanup()
+
+    def test_small_fallback(self):
+        """Test small frames fall back to a plain html table."""
+        item = report_large_table(make_dfr(10), self.tmp.name, max_rows=100)
+        assert item['type'] == 'markdown'
+        assert item['content'].startswith('<table')
+        assert os.listdir(self.tmp.name) == []
+
+    def test_pages_and_sidecar(self):
+        """Test page count, chunk contents & sidecar output."""
+        dfr = make_dfr(1050)
+        item = report_large_table(
+            dfr, self.tmp.name, hdr='Big Table', max_rows=100, page_size=500)
+        assert item['type'] == 'code'
+        files = os.listdir(self.tmp.name)
+        sidecar = [x for x in files if x.endswith(('.parquet', '.csv.gz'))]
+        assert len(sidecar) == 1
+        page_dir = join(self.tmp.name, sidecar[0].split('.')[0])
+        assert sorted(os.listdir(page_dir)) == ['0.js', '1.js', '2.js']
+
+        last = read_page(join(page_dir, '2.js'))
+        assert last['index'] is None
+        assert len(last['data']) == 50
+        assert last['data'][0][1] == dfr['label'].iloc[1000]
+        assert abs(last['data'][0][0] - dfr['x'].iloc[1000]) < 1e-3
+
+        if sidecar[0].endswith('.csv.gz'):
+            full = pd.read_csv(join(self.tmp.name, sidecar[0]), index_col=0)
+        else:
+            full = pd.read_parquet(join(self.tmp.name, sidecar[0]))
+        assert len(full) == len(dfr)
+
+    def test_sidecar_fallback(self):
+        """Test unserializable frames fall back to a csv.gz sidecar."""
+        with mock.patch.object(
+                pd.DataFrame, 'to_parquet', side_effect=TypeError('mixed')):
+            report_large_table(make_dfr(200), self.tmp.name, max_rows=100)
+        assert [
+            x for x in os.listdir(self.tmp.name) if x.endswith('.csv.gz')]
+
+    def test_custom_index_pages(self):
+        """Test non-default index values are written to chunks."""
+        dfr = make_dfr(150).set_index('label', drop=False)
+        report_large_table(dfr, self.tmp.name, max_rows=100, page_size=100)
+        page_dir = [
+            join(self.tmp.name, x) for x in os.listdir(self.tmp.name)
+            if os.path.isdir(join(self.tmp.name, x))
+        ][0]
+        assert read_page(join(page_dir, '1.js'))['index'][0] == dfr.index[100]
+
+    def test_summary_fixed_size(self):
+        """Test embedded report content does not grow with rows."""
+        sizes = [
+            len(report_large_table(
+                make_dfr(n_rows), self.tmp.name, max_rows=100)['content'])
+            for n_rows in [1000, 100000]
+        ]
+        assert abs(sizes[1] - sizes[0]) < 0.05 * sizes[0]
+
+    def test_escaped_markup(self):
+        """Test cell markup is escaped in the summary & not in js html."""
+        item = report_large_table(make_dfr(200), self.tmp.name, max_rows=100)
+        assert '&lt;b&gt;&amp;' in item['content']
+        assert 'innerHTML' not in item['content']
+
+
+# # Main Entry
+# -----------------------------------------------------|
+if __name__ == "__main__":
+    unittest.main()
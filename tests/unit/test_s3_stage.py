@@ -0,0 +1,149 @@
+"""
+Module housing S3 input staging unit tests.
+
+# NOTES
+# ----------------------------------------------------------------------------|
+Uses a local in-memory stand-in for the boto3 s3 client.
+
+
+By Samuel Thorpe
+"""
+
+
+# # Imports
+# -----------------------------------------------------|
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import unittest
+from st_experiment_template.utils.s3_stage import S3Stager, split_uri
+
+
+# # Local S3 stand-in
+# -----------------------------------------------------|
+class LocalS3:
+    """In-memory s3 client stand-in supporting head & ranged get."""
+
+    def __init__(self):
+        """Initialize class."""
+        self.objects = {}
+        self.gets = 0
+        self.lock = threading.Lock()
+
+    def put(self, uri, body):
+        """Store body at uri."""
+        self.objects[split_uri(uri)] = body
+
+    def head_object(self, Bucket, Key):
+        """Return object etag & size."""
+        body = self.objects[(Bucket, Key)]
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        return dict(ETag=etag, ContentLength=len(body))
+
+    def get_object(self, Bucket, Key, IfMatch=None, Range=None):
+        """Return object body, or byte range of it."""
+        with self.lock:
+            self.gets += 1
+        body = self.objects[(Bucket, Key)]
+        if IfMatch is not None:
+            assert IfMatch == self.head_object(Bucket, Key)['ETag']
+        if Range is not None:
+            start, end = map(int, Range.split('=')[1].split('-'))
+            body = body[start:end + 1]
+        return dict(Body=io.BytesIO(body))
+
+
+# # Main Class
+# -----------------------------------------------------|
+class TestS3Stage(unittest.TestCase):
+    """Test staging, cache validation & eviction."""
+
+    def setUp(self):
+        """Create stand-in client & temp cache dir."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.s3 = LocalS3()
+        self.s3.put('s3://bucket/a.bin', os.urandom(1000))
+        self.s3.put('s3://bucket/b.bin', os.urandom(600))
+
+    def tearDown(self):
+        """Remove temp cache dir."""
+        self.tmp.cleanup()
+
+    def _stager(self, **kwrgs):
+        """Return stager over stand-in client."""
+        return S3Stager(self.tmp.name, part_size=128, client=self.s3, **kwrgs)
+
+    def test_stage_ranged(self):
+        """Test objects are reassembled from ranged gets."""
+        out = self._stager().stage_all(dict(
+            a='s3://bucket/a.bin', b=dict(uri='s3://bucket/b.bin', mmap=True)
+        ))
+        objects = self.s3.objects
+        assert open(out['a'], 'rb').read() == objects['bucket', 'a.bin']
+        assert out['b'][:] == objects['bucket', 'b.bin']
+        assert self.s3.gets == 8 + 5
+
+    def test_cache_hit_and_etag(self):
+        """Test re-staging hits cache until the object etag changes."""
+        self._stager().stage_all(dict(a='s3://bucket/a.bin'))
+        gets = self.s3.gets
+        self._stager().stage_all(dict(a='s3://bucket/a.bin'))
+        assert self.s3.gets == gets
+
+        self.s3.put('s3://bucket/a.bin', b'changed')
+        out = self._stager().stage_all(dict(a='s3://bucket/a.bin'))
+        assert open(out['a'], 'rb').read() == b'changed'
+        assert self.s3.gets == gets + 1
+
+    def test_eviction(self):
+        """Test least recently used objects are evicted over max_bytes."""
+        pth_a = self._stager(max_bytes=1200).stage_all(
+            dict(a='s3://bucket/a.bin'))['a']
+        pth_b = self._stager(max_bytes=1200).stage_all(
+            dict(b='s3://bucket/b.bin'))['b']
+        assert not os.path.exists(pth_a)
+        assert os.path.exists(pth_b)
+        assert list(self._stager().index) == ['s3://bucket/b.bin']
+
+    def test_keep_staged(self):
+        """Test objects staged earlier by the same stager are not evicted."""
+        stager = self._stager(max_bytes=1200)
+        pth_a = stager.stage_all(dict(a='s3://bucket/a.bin'))['a']
+        pth_b = stager.stage_all(dict(b='s3://bucket/b.bin'))['b']
+        assert os.path.exists(pth_a) and os.path.exists(pth_b)
+
+    def test_empty_mmap(self):
+        """Test empty objects stage as an empty buffer when mmapped."""
+        self.s3.put('s3://bucket/empty.bin', b'')
+        out = self._stager().stage_all(
+            dict(e=dict(uri='s3://bucket/empty.bin', mmap=True)))
+        assert out['e'] == b''
+
+    def test_index_merge(self):
+        """Test stagers sharing a cache dir keep each other's entries."""
+        stager_a, stager_b = self._stager(), self._stager()
+        stager_a.stage_all(dict(a='s3://bucket/a.bin'))
+        stager_b.stage_all(dict(b='s3://bucket/b.bin'))
+        assert sorted(self._stager().index) == \
+            ['s3://bucket/a.bin', 's3://bucket/b.bin']
+
+    def test_evict_unindexed(self):
+        """Test objects missing from the index are counted & evicted."""
+        pth_a = self._stager().stage_all(dict(a='s3://bucket/a.bin'))['a']
+        os.remove(os.path.join(self.tmp.name, 'index.json'))
+        pth_b = self._stager(max_bytes=1200).stage_all(
+            dict(b='s3://bucket/b.bin'))['b']
+        assert not os.path.exists(pth_a)
+        assert os.path.exists(pth_b)
+        assert not [
+            x for x in os.listdir(os.path.dirname(pth_b))
+            if x.endswith('.part')
+        ]
+
+
+# # Main Entry
+# -----------------------------------------------------|
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,217 @@
+"""
+Module housing experiment service unit tests.
+
+# NOTES
+# ----------------------------------------------------------------------------|
+
+
+By Samuel Thorpe
+"""
+
+
+# # Imports
+# -----------------------------------------------------|
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+from os.path import dirname, join
+from st_experiment_template.experiment import Block, Experiment
+from st_experiment_template.service import (
+    ArtifactCache, ExperimentService, result, submit)
+
+
+# # Globals
+# -----------------------------------------------------|
+test_dir = dirname(__file__)
+
+
+# # Helpers
+# -----------------------------------------------------|
+def poll_until(service, name, timeout=30):
+    """Poll service until run name has a result; return it."""
+    tic = time.time()
+    while time.time() - tic < timeout:
+        service.poll()
+        try:
+            return result(name, service.spool_dir, timeout=0.05)
+        except TimeoutError:
+            pass
+    raise TimeoutError(f'no result for {name}')
+
+
+# # Test blocks
+# -----------------------------------------------------|
+class PidBlock(Block):
+    """Block recording its worker pid & out_dir."""
+
+    def run(self):
+        """Run main method."""
+        self._data['pid'] = os.getpid()
+        with open(join(self._out_dir, 'pid.txt'), 'w') as fh:
+            fh.write(str(os.getpid()))
+
+
+class CrashBlock(Block):
+    """Block killing its worker process."""
+
+    def run(self):
+        """Run main method."""
+        os._exit(1)
+
+
+# # Main Class
+# -----------------------------------------------------|
+class TestService(unittest.TestCase):
+    """Test spooled configs run isolated on warm workers."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start service on temp spool."""
+        Experiment.out_dir = join(test_dir, 'run', 'batch')
+        cls.tmp = tempfile.TemporaryDirectory()
+        Experiment.state_dir = join(cls.tmp.name, 'state')
+        cls.spool = join(cls.tmp.name, 'spool')
+        cls.service = ExperimentService(cls.spool, workers=2)
+        cls.cfg = join(cls.tmp.name, 'cfg.yaml')
+        with open(cls.cfg, 'w') as fh:
+            fh.write(f'PidBlock:\n  module: {__name__}\n')
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop service."""
+        cls.service.close()
+        cls.tmp.cleanup()
+
+    def test_runs(self):
+        """Test runs complete with per-run out_dirs on the worker pool."""
+        names = [submit(self.cfg, self.spool) for _ in range(4)]
+        assert self.service.poll() == 4
+        results = [result(x, self.spool, timeout=30) for x in names]
+        assert all(x['status'] == 'ok' for x in results), results
+        assert len({x['out_dir'] for x in results}) == 4
+        assert len({x['pid'] for x in results}) <= 2
+        for res in results:
+            pth = join(res['out_dir'], '0-PidBlock', 'pid.txt')
+            assert open(pth).read() == str(res['pid'])
+        assert os.listdir(join(self.spool, 'running')) == []
+
+    def test_failed_run(self):
+        """Test a bad config reports failure without killing the service."""
+        bad_cfg = join(self.tmp.name, 'bad.yaml')
+        with open(bad_cfg, 'w') as fh:
+            fh.write('MissingBlock:\n  module: no_such_module\n')
+        name = submit(bad_cfg, self.spool)
+        self.service.poll()
+        res = result(name, self.spool, timeout=30)
+        assert res['status'] == 'failed'
+        assert 'no_such_module' in res['error']
+
+    def test_artifact_cache(self):
+        """Test artifact cache reloads only on change."""
+        cache, calls = ArtifactCache(max_items=1), []
+        pth = join(self.tmp.name, 'artifact.txt')
+        with open(pth, 'w') as fh:
+            fh.write('a')
+
+        def loader(pth):
+            calls.append(pth)
+            return open(pth).read()
+
+        assert cache.get(pth, loader) == cache.get(pth, loader) == 'a'
+        os.symlink(pth, join(self.tmp.name, 'link.txt'))
+        assert cache.get(join(self.tmp.name, 'link.txt'), loader) == 'a'
+        assert len(calls) == 1
+        with open(pth, 'w') as fh:
+            fh.write('bb')
+        assert cache.get(pth, loader) == 'bb'
+        assert len(cache.items) == 1
+
+    def test_artifact_cache_bytes(self):
+        """Test artifact cache is bounded by total file size."""
+        cache = ArtifactCache(max_bytes=10)
+        pths = [join(self.tmp.name, f'bytes{x}.txt') for x in range(3)]
+        for pth, size in zip(pths, [4, 4, 20]):
+            with open(pth, 'w') as fh:
+                fh.write('x' * size)
+            cache.get(pth, lambda pth: open(pth).read())
+        assert len(cache.items) == 2 and cache.n_bytes == 8
+        with open(pths[0], 'w') as fh:
+            fh.write('x' * 8)
+        cache.get(pths[0], lambda pth: open(pth).read())
+        assert len(cache.items) == 1 and cache.n_bytes == 8
+
+    def test_duplicate_drop(self):
+        """Test the same config dropped twice runs under distinct names."""
+        incoming = join(self.spool, 'incoming')
+        for _ in range(2):
+            shutil.copy(self.cfg, join(incoming, 'dup.yaml'))
+            self.service.poll()
+        tic = time.time()
+        while time.time() - tic < 30:
+            done = [
+                x for x in os.listdir(join(self.spool, 'done'))
+                if x.startswith('dup') and x.endswith('.json')
+            ]
+            if len(done) == 2:
+                break
+            time.sleep(0.05)
+        results = [
+            result(x[:-len('.json')], self.spool) for x in sorted(done)]
+        assert all(x['status'] == 'ok' for x in results), results
+        assert 'dup' in {x['name'] for x in results}
+        assert len({x['out_dir'] for x in results}) == 2
+        assert not self.service.pending
+
+    def test_report_push_run_dir(self):
+        """Test report & push use the run dir of a per-run out_dir."""
+        run_dir = join(self.tmp.name, 'runs', 'report-run')
+        exp = Experiment(self.cfg, out_dir=join(run_dir, 'batch'))
+        exp.params.update(
+            report=dict(report_fn='rpt'), push=dict(bucket='b'),
+            registry=False)
+        with mock.patch('st_experiment_template.experiment.Report.export'), \
+                mock.patch('st_experiment_template.experiment.AwsS3') as s3:
+            exp.run()
+        assert ('report', join(run_dir, 'report', 'rpt')) in exp.artifacts
+        upload = s3.return_value.upload_folder_to_s3
+        assert upload.call_args.kwargs['local_dir'] == run_dir
+
+    def test_worker_crash(self):
+        """Test a dead worker fails its run & the pool is restarted."""
+        crash_cfg = join(self.tmp.name, 'crash.yaml')
+        with open(crash_cfg, 'w') as fh:
+            fh.write(f'CrashBlock:\n  module: {__name__}\n')
+        name = submit(crash_cfg, self.spool)
+        self.service.poll()
+        res = result(name, self.spool, timeout=30)
+        assert res['status'] == 'failed'
+        assert 'worker process died' in res['error']
+
+        name = submit(self.cfg, self.spool)
+        self.service.poll()
+        assert result(name, self.spool, timeout=30)['status'] == 'ok'
+
+    def test_worker_crash_requeue(self):
+        """Test configs queued behind a dead worker are requeued."""
+        spool = join(self.tmp.name, 'spool1')
+        service = ExperimentService(spool, workers=1)
+        try:
+            crash_cfg = join(self.tmp.name, 'crash.yaml')
+            with open(crash_cfg, 'w') as fh:
+                fh.write(f'CrashBlock:\n  module: {__name__}\n')
+            crash = submit(crash_cfg, spool, name='a-crash')
+            queued = submit(self.cfg, spool, name='b-queued')
+            assert service.poll() == 2
+            assert poll_until(service, crash)['status'] == 'failed'
+            assert poll_until(service, queued)['status'] == 'ok'
+        finally:
+            service.close()
+
+
+# # Main Entry
+# -----------------------------------------------------|
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+"""
+Module housing native thread budgeting unit tests.
+
+# NOTES
+# ----------------------------------------------------------------------------|
+
+
+By Samuel Thorpe
+"""
+
+
+# # Imports
+# -----------------------------------------------------|
+import os
+import tempfile
+import unittest
+from unittest import mock
+from contextlib import contextmanager
+from os.path import join
+from st_experiment_template.experiment import Block, Experiment
+from st_experiment_template.utils import threads
+from st_experiment_template.utils.threads import (
+    THREAD_ENV_VARS, cpu_budget, set_thread_limits, split_budget,
+    thread_limits)
+
+
+# # Test blocks
+# -----------------------------------------------------|
+ACTIVE_LIMITS = []
+
+
+class LimitedBlock(Block):
+    """Block recording the thread limits active while it runs."""
+
+    def run(self):
+        """Run main method."""
+        self._data[self.__class__.__name__] = list(ACTIVE_LIMITS)
+
+
+class UnlimitedBlock(LimitedBlock):
+    """Block run without threads params."""
+
+    pass
+
+
+@contextmanager
+def fake_thread_limits(n_threads):
+    """Record n_threads as active instead of limiting native pools."""
+    ACTIVE_LIMITS.append(n_threads)
+    try:
+        yield
+    finally:
+        ACTIVE_LIMITS.pop()
+
+
+# # Main Class
+# -----------------------------------------------------|
+class TestThreads(unittest.TestCase):
+    """Test thread budget splitting & limits."""
+
+    def test_cpu_budget(self):
+        """Test cpu budget is positive."""
+        assert cpu_budget() >= 1
+
+    def test_set_thread_limits_budget(self):
+        """Test persistent limits cap the cpu budget."""
+        with mock.patch.object(threads, '_process_budget', None), \
+                mock.patch.dict(os.environ), \
+                mock.patch.object(threads, 'threadpool_limits', None):
+            set_thread_limits(1)
+            assert cpu_budget() == 1
+            assert all(os.environ[x] == '1' for x in THREAD_ENV_VARS)
+        assert threads._process_budget is None
+
+    def test_split_budget(self):
+        """Test explicit & auto requests split the budget."""
+        assert split_budget(8, [None]) == [8]
+        assert split_budget(8, [None, None, None]) == [2, 2, 2]
+        assert split_budget(8, [2, None, None]) == [2, 3, 3]
+        assert split_budget(8, [16]) == [8]
+        assert split_budget(2, [2, None]) == [2, 1]
+
+    def test_thread_limits_env(self):
+        """Test thread env vars are set within & restored after limits."""
+        os.environ['OMP_NUM_THREADS'] = '7'
+        os.environ.pop('MKL_NUM_THREADS', None)
+        with thread_limits(2):
+            assert os.environ['OMP_NUM_THREADS'] == '2'
+            assert os.environ['MKL_NUM_THREADS'] == '2'
+        assert os.environ.pop('OMP_NUM_THREADS') == '7'
+        assert 'MKL_NUM_THREADS' not in os.environ
+
+
+class TestExperimentThreads(unittest.TestCase):
+    """Test per-block thread budgets are applied around block runs."""
+
+    def _run_cfg(self, lines):
+        """Write & run experiment cfg on a stand-in 8 cpu budget."""
+        with tempfile.TemporaryDirectory() as tmp:
+            cfg = join(tmp, 'cfg.yaml')
+            with open(cfg, 'w') as fh:
+                fh.write('\n'.join([
+                    'ExperimentParams:', '  registry: False', *lines]))
+            exp = Experiment(cfg, out_dir=join(tmp, 'batch'))
+            with mock.patch(
+                    'st_experiment_template.experiment.thread_limits',
+                    fake_thread_limits), \
+                    mock.patch(
+                        'st_experiment_template.experiment.cpu_budget',
+                        return_value=8):
+                exp.run()
+
+        return exp
+
+    def test_block_threads(self):
+        """Test block threads are applied & logged; lone blocks unlimited."""
+        with self.assertLogs(
+                'st_experiment_template.experiment', 'INFO') as logs:
+            exp = self._run_cfg([
+                'LimitedBlock:', f'  module: {__name__}', '  threads: 2',
+                'UnlimitedBlock:', f'  module: {__name__}',
+            ])
+        assert exp.data['LimitedBlock'] == [2]
+        assert exp.data['UnlimitedBlock'] == []
+        assert any(
+            "running ['LimitedBlock'] with 2 native thread(s)" in x
+            for x in logs.output)
+
+    def test_experiment_threads(self):
+        """Test ExperimentParams threads caps every block."""
+        exp = self._run_cfg([
+            '  threads: 3',
+            'LimitedBlock:', f'  module: {__name__}', '  threads: 8',
+            'UnlimitedBlock:', f'  module: {__name__}',
+        ])
+        assert exp.data['LimitedBlock'] == [3]
+        assert exp.data['UnlimitedBlock'] == [3]
+
+
+# # Main Entry
+# -----------------------------------------------------|
+if __name__ == "__main__":
+    unittest.main()
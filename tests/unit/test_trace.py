@@ -0,0 +1,159 @@
+"""
+Module housing trace span unit tests.
+
+# NOTES
+# ----------------------------------------------------------------------------|
+
+
+By Samuel Thorpe
+"""
+
+
+# # Imports
+# -----------------------------------------------------|
+import asyncio
+import json
+import tempfile
+import unittest
+from unittest import mock
+from os.path import join
+from st_experiment_template.experiment import (
+    Block, CheckRunBlock, Experiment)
+from st_experiment_template.utils.trace import span, tracer
+
+
+# # Test blocks
+# -----------------------------------------------------|
+class TracedBlock(CheckRunBlock):
+    """CheckRunBlock caching a single output."""
+
+    outputs = dict(val='val.pkl')
+
+    def run(self):
+        """Run main method."""
+        return dict(val=1)
+
+
+class TracedAsyncBlock(Block):
+    """Async block consuming the cached output."""
+
+    async def run(self):
+        """Run main method."""
+        await asyncio.sleep(0)
+        self._data['out'] = self._data['val']() + 1
+
+
+# # Main Class
+# -----------------------------------------------------|
+class TestTrace(unittest.TestCase):
+    """Test span recording & chrome trace export."""
+
+    def tearDown(self):
+        """Disable tracer between tests."""
+        tracer.stop()
+
+    def test_disabled(self):
+        """Test no events are recorded when disabled."""
+        tracer.start()
+        tracer.stop()
+        with span('noop'):
+            pass
+        assert tracer.events == []
+
+    def test_nested_spans(self):
+        """Test context manager & decorator spans nest."""
+        @span('inner', cat='test', key='val')
+        def inner():
+            return 1
+
+        tracer.start()
+        with span('outer'):
+            assert inner() == 1
+        names = [x['name'] for x in tracer.events]
+        assert names == ['inner', 'outer']
+        inner_evt, outer_evt = tracer.events
+        assert inner_evt['args'] == {'key': 'val'}
+        assert inner_evt['ts'] >= outer_evt['ts']
+        assert inner_evt['dur'] <= outer_evt['dur']
+
+    def test_error_span(self):
+        """Test spans closed by an exception record the error."""
+        tracer.start()
+        with self.assertRaises(ValueError):
+            with span('fails'):
+                raise ValueError()
+        assert tracer.events[0]['args']['error'] == 'ValueError'
+
+    def test_export(self):
+        """Test exported json is in chrome trace-event format."""
+        tracer.start()
+        with span('outer'):
+            pass
+        with tempfile.TemporaryDirectory() as tmp:
+            pth = join(tmp, 'trace', 'trace.json')
+            tracer.export(pth)
+            dat = json.load(open(pth))
+        phases = sorted(x['ph'] for x in dat['traceEvents'])
+        assert phases == ['M', 'X']
+
+    def test_async_task_spans(self):
+        """Test overlapping spans in concurrent tasks get their own tids."""
+        async def work(idx):
+            with span(f'work{idx}'):
+                await asyncio.sleep(0.01)
+
+        async def main():
+            await asyncio.gather(*[
+                asyncio.create_task(work(x), name=f'w{x}') for x in range(2)])
+
+        tracer.start()
+        asyncio.run(main())
+        tids = {x['name']: x['tid'] for x in tracer.events}
+        assert tids['work0'] != tids['work1']
+        with tempfile.TemporaryDirectory() as tmp:
+            tracer.export(join(tmp, 'trace.json'))
+            dat = json.load(open(join(tmp, 'trace.json')))
+        names = {
+            x['args']['name'] for x in dat['traceEvents'] if x['ph'] == 'M'}
+        assert names == {'task w0', 'task w1'}
+
+    def test_experiment_trace(self):
+        """Test an experiment run writes block, io, report & push spans."""
+        with tempfile.TemporaryDirectory() as tmp:
+            cfg, pth = join(tmp, 'cfg.yaml'), join(tmp, 'trace.json')
+            with open(cfg, 'w') as fh:
+                fh.write('\n'.join([
+                    'ExperimentParams:',
+                    '  registry: False',
+                    '  report:',
+                    '    report_fn: rpt',
+                    '  push:',
+                    '    bucket: b',
+                    '  trace:',
+                    f'    path: {pth}',
+                    'TracedBlock:',
+                    f'  module: {__name__}',
+                    '  recompute: True',
+                    'TracedAsyncBlock:',
+                    f'  module: {__name__}',
+                ]))
+            exp = Experiment(cfg, out_dir=join(tmp, 'run', 'batch'))
+            with mock.patch('st_experiment_template.experiment.AwsS3'), \
+                    mock.patch(
+                        'st_experiment_template.experiment.report.call'):
+                exp.run()
+            events = json.load(open(pth))['traceEvents']
+        assert exp.data['out'] == 2
+        names = {x['name'] for x in events}
+        assert {
+            'Experiment.run', 'TracedBlock.check_run', 'Block._cache',
+            'Block._load', 'TracedAsyncBlock.run', 'Report.build',
+            'Report.export', 'nbconvert', 'Experiment._push'
+        } <= names, names
+        assert ('trace', pth) in exp.artifacts
+
+
+# # Main Entry
+# -----------------------------------------------------|
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+"""
+Module housing watch mode unit tests.
+
+# NOTES
+# ----------------------------------------------------------------------------|
+
+
+By Samuel Thorpe
+"""
+
+
+# # Imports
+# -----------------------------------------------------|
+import os
+import sys
+import tempfile
+import unittest
+from os.path import dirname, join
+from st_experiment_template.experiment import Experiment
+from st_experiment_template.utils.watch import BlockWatcher
+
+
+# # Globals
+# -----------------------------------------------------|
+test_dir = dirname(__file__)
+BLOCK_SRC = '''
+from st_experiment_template.experiment import Block
+
+
+class {name}(Block):
+
+    def run(self):
+        self._data['{name}'] = self._data.get('{name}', 0) + {val}
+'''
+CHECK_BLOCK_SRC = '''
+from st_experiment_template.experiment import Block, CheckRunBlock
+
+
+class {name}(CheckRunBlock):
+
+    outputs = dict(d='d.pkl')
+
+    def run(self):
+        return dict(d={val})
+
+
+class BlockE(Block):
+
+    def run(self):
+        self._data['e'] = self._data['d']() + 1
+'''
+ASYNC_BLOCK_SRC = '''
+import asyncio
+from st_experiment_template.experiment import Block
+
+
+class {name}(Block):
+
+    async def run(self):
+        await asyncio.gather(*[
+            self._limit(asyncio.sleep(0.01)) for _ in range(3)])
+        self._data['{name}'] = self._data.get('{name}', 0) + {val}
+'''
+
+
+# # Main Class
+# -----------------------------------------------------|
+class TestWatch(unittest.TestCase):
+    """Test changed blocks are reloaded & re-run with downstream blocks."""
+
+    def setUp(self):
+        """Write block modules & cfg to temp dir on sys.path."""
+        Experiment.out_dir = join(test_dir, 'run', 'batch')
+        self.tmp = tempfile.TemporaryDirectory()
+        Experiment.state_dir = join(self.tmp.name, 'state')
+        sys.path.insert(0, self.tmp.name)
+        self._write('watch_block_a', 'BlockA', 1)
+        self._write('watch_block_b', 'BlockB', 1)
+        self._write('watch_block_c', 'BlockC', 1, ASYNC_BLOCK_SRC)
+        self.cfg = join(self.tmp.name, 'cfg.yaml')
+        with open(self.cfg, 'w') as fh:
+            fh.write('ExperimentParams:\n  asyncio:\n    max_concurrency: 1\n')
+            for name in 'ABC':
+                module = f'watch_block_{name.lower()}'
+                fh.write(f'Block{name}:\n  module: {module}\n')
+
+    def tearDown(self):
+        """Remove temp modules."""
+        sys.path.remove(self.tmp.name)
+        for name in 'abcd':
+            sys.modules.pop(f'watch_block_{name}', None)
+        self.tmp.cleanup()
+
+    def _write(self, module, name, val, src=BLOCK_SRC):
+        """Write block module source & bump its mtime."""
+        pth = join(self.tmp.name, f'{module}.py')
+        with open(pth, 'w') as fh:
+            fh.write(src.format(name=name, val=val))
+        mtime = os.stat(pth).st_mtime_ns + 10**9 * val
+        os.utime(pth, ns=(mtime, mtime))
+
+    def test_rerun_changed(self):
+        """Test a changed block & its downstream (async) blocks re-run."""
+        exp = Experiment(self.cfg)
+        exp.run()
+        watcher = BlockWatcher(exp)
+        assert watcher.check() is None
+        block_a = exp.blocks[0]
+
+        self._write('watch_block_b', 'BlockB', 10)
+        assert watcher.check() == 1
+        assert exp.blocks[0] is block_a
+        assert exp.data == dict(BlockA=1, BlockB=11, BlockC=2)
+
+    def test_rerun_check_run_block(self):
+        """Test a changed CheckRunBlock recomputes its cached outputs."""
+        self._write('watch_block_d', 'BlockD', 1, CHECK_BLOCK_SRC)
+        cfg = join(self.tmp.name, 'cfg_d.yaml')
+        with open(cfg, 'w') as fh:
+            fh.write('ExperimentParams:\n  registry: False\n')
+            fh.write('BlockD:\n  module: watch_block_d\n  recompute: False\n')
+            fh.write('BlockE:\n  module: watch_block_d\n')
+        exp = Experiment(cfg, out_dir=join(self.tmp.name, 'batch'))
+        exp.run()
+        assert exp.data['e'] == 2
+        watcher = BlockWatcher(exp)
+
+        self._write('watch_block_d', 'BlockD', 10, CHECK_BLOCK_SRC)
+        assert watcher.check() == 0
+        assert exp.data['e'] == 11
+
+
+# # Main Entry
+# -----------------------------------------------------|
+if __name__ == "__main__":
+    unittest.main()